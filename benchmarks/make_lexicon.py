@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+make_lexicon writes the WN-LMF lexicon the benchmarks run against.
+
+It's a handful of real entries, a highly polysemous "run" and a few hundred
+made-up filler words that share prefixes and link to each other, some as
+antonyms, so every part of the lookup and completion code has something to
+chew on. The output is checked in as data/bench-lexicon.xml; run this again
+after changing it.
+"""
+
+import os
+from html import escape
+from itertools import product
+
+LEXICON_ID = "bench"
+LEXICON_VERSION = "1"
+OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bench-lexicon.xml")
+
+SYLLABLES = ("ba", "ce", "di", "fo", "gu", "ka", "le", "mi", "no", "pu", "ra", "se")
+FILLER_POS = ("n", "v", "a")
+
+REAL_ENTRIES = (
+    # (lemma, pos, synset, definition, examples)
+    ("dog", "n", "dog-n", "a member of the genus Canis", ("the dog barked all night",)),
+    ("domestic dog", "n", "dog-n", None, ()),
+    ("good", "a", "good-a", "having desirable or positive qualities", ("a good report card",)),
+    ("bad", "a", "bad-a", "having undesirable or negative qualities", ()),
+    ("fine", "s", "fine-s", "superior to the average", ()),
+    ("set", "n", "set-n", "a group of things of the same kind that belong together", ("a set of books",)),
+    ("Set", "n", "set-god-n", "an Egyptian god", ()),
+    ("café", "n", "cafe-n", "a small restaurant", ()),
+)
+
+RUN_SENSES = {
+    "v": (
+        "move fast by using one's feet",
+        "flee; take to one's heels",
+        "stretch out over a distance, space, time, or scope",
+        "direct or control; projects, businesses, etc.",
+        "have a particular form",
+        "move along, of liquids",
+        "perform as expected when applied",
+        "change or be different within limits",
+        "run, stand, or compete for an office or a position",
+        "cause to emit recorded audio or video",
+        "move about freely and without restraint",
+        "have a tendency or disposition to do or be something",
+        "be operating, running or functioning",
+        "change from one state to another",
+        "cause to perform",
+        "be affected by; be subjected to",
+        "continue to exist",
+        "be diffused",
+        "sail before the wind",
+        "cover by running; run a certain distance",
+        "extend or continue for a certain period of time",
+        "set animals loose to graze",
+        "keep company",
+        "run with the ball; in such sports as football",
+        "travel rapidly, by any means of locomotion",
+        "carry out a process or program",
+        "guide or pass over something",
+        "cause something to pass or lead somewhere",
+        "make without a miss",
+        "deal in illegally, such as arms or liquor",
+    ),
+    "n": (
+        "a score in baseball made by a runner touching all four bases safely",
+        "the act of testing something",
+        "a race run on foot",
+        "an unbroken series of events",
+        "the continuous period of time during which something happens",
+        "the production achieved during a continuous period of operation",
+        "a small stream",
+        "a race between candidates for elective office",
+        "a row of unravelled stitches",
+        "the pouring forth of a fluid",
+        "an unrestricted freedom to use",
+        "the act of running; traveling on foot at a fast pace",
+    ),
+}
+RUN_COMEMBERS = ("operate", "go", "flow", "lead", "race", "extend", "range", "feed", "execute", "melt")
+
+
+def filler_words():
+    """Made-up words from every pair and triple of syllables, in a stable order."""
+    words = ["".join(pair) for pair in product(SYLLABLES, repeat=2)]
+    words += ["".join(triple) for triple in product(SYLLABLES[:6], repeat=3)]
+    return words
+
+
+def to_xml(entries, synsets, sense_relations) -> list:
+    """Lay out the entries, synsets and sense relations as the lines of a WN-LMF file."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<!DOCTYPE LexicalResource SYSTEM "http://globalwordnet.github.io/schemas/WN-LMF-1.1.dtd">',
+        '<LexicalResource xmlns:dc="https://globalwordnet.github.io/schemas/dc/">',
+        f'  <Lexicon id="{LEXICON_ID}" label="Wordbook Benchmark WordNet" language="en"'
+        f' email="wordbook@example.com" license="https://creativecommons.org/licenses/by/4.0/"'
+        f' version="{LEXICON_VERSION}">',
+    ]
+    members = {}
+    for (lemma, pos), senses in entries.items():
+        lines.append(f'    <LexicalEntry id="{LEXICON_ID}-{escape(lemma.replace(" ", "_"))}-{pos}">')
+        lines.append(f'      <Lemma writtenForm="{escape(lemma)}" partOfSpeech="{pos}"/>')
+        for sense_id, synset_id in senses:
+            if sense_id in sense_relations:
+                lines.append(f'      <Sense id="{escape(sense_id)}" synset="{escape(synset_id)}">')
+                for rel_type, target in sense_relations[sense_id]:
+                    lines.append(f'        <SenseRelation relType="{rel_type}" target="{escape(target)}"/>')
+                lines.append("      </Sense>")
+            else:
+                lines.append(f'      <Sense id="{escape(sense_id)}" synset="{escape(synset_id)}"/>')
+            members.setdefault(synset_id, []).append(sense_id)
+        lines.append("    </LexicalEntry>")
+    for synset_id, (pos, definition, examples, relations) in synsets.items():
+        member_ids = escape(" ".join(members[synset_id]))
+        lines.append(f'    <Synset id="{escape(synset_id)}" ili="" partOfSpeech="{pos}" members="{member_ids}">')
+        if definition:
+            lines.append(f"      <Definition>{escape(definition)}</Definition>")
+        for example in examples:
+            lines.append(f"      <Example>{escape(example)}</Example>")
+        for rel_type, target in relations:
+            lines.append(f'      <SynsetRelation relType="{rel_type}" target="{escape(target)}"/>')
+        lines.append("    </Synset>")
+    lines += ["  </Lexicon>", "</LexicalResource>", ""]
+    return lines
+
+
+def main():
+    entries = {}  # (lemma, pos) -> list of (sense id, synset id)
+    synsets = {}  # synset id -> (pos, definition, examples, relations)
+    antonyms = []  # (sense id, (lemma, pos) whose first sense is the antonym)
+
+    def add_sense(lemma, pos, synset_id):
+        senses = entries.setdefault((lemma, pos), [])
+        sense_id = f"{LEXICON_ID}-{lemma.replace(' ', '_')}-{pos}-{len(senses) + 1}"
+        senses.append((sense_id, synset_id))
+        return sense_id
+
+    for lemma, pos, synset, definition, examples in REAL_ENTRIES:
+        synset_id = f"{LEXICON_ID}-s-{synset}"
+        if synset_id not in synsets:
+            synsets[synset_id] = (pos, definition, examples, [])
+        add_sense(lemma, pos, synset_id)
+    antonyms.append((entries[("good", "a")][0][0], ("bad", "a")))
+    antonyms.append((entries[("bad", "a")][0][0], ("good", "a")))
+    synsets[f"{LEXICON_ID}-s-good-a"][3].append(("also", f"{LEXICON_ID}-s-fine-s"))
+    synsets[f"{LEXICON_ID}-s-fine-s"][3].append(("similar", f"{LEXICON_ID}-s-good-a"))
+
+    for pos, definitions in RUN_SENSES.items():
+        for i, definition in enumerate(definitions, 1):
+            synset_id = f"{LEXICON_ID}-s-run-{pos}-{i}"
+            examples = (f"they had to run {i} times",) if i % 2 else (f"the run lasted {i} days", "it was a long run")
+            relations = [("also", f"{LEXICON_ID}-s-run-{pos}-{i - 1}")] if i > 1 and i % 3 == 0 else []
+            synsets[synset_id] = (pos, definition, examples, relations)
+            add_sense("run", pos, synset_id)
+            if pos == "v":
+                add_sense(RUN_COMEMBERS[i % len(RUN_COMEMBERS)], pos, synset_id)
+
+    words = filler_words()
+    for i, word in enumerate(words):
+        pos = FILLER_POS[i % len(FILLER_POS)]
+        synset_id = f"{LEXICON_ID}-s-{word}-{pos}"
+        partner = words[(i + len(FILLER_POS)) % len(words)]
+        relations = [("similar", f"{LEXICON_ID}-s-{partner}-{pos}")] if pos == "a" else []
+        synsets[synset_id] = (pos, f"the {pos} sense of {word}", (f"a sentence with {word} in it",), relations)
+        sense_id = add_sense(word, pos, synset_id)
+        if pos == "a":
+            antonyms.append((sense_id, (partner, pos)))
+        add_sense(f"{word} {partner}", pos, synset_id)
+
+    sense_relations = {}
+    for sense_id, target in antonyms:
+        sense_relations.setdefault(sense_id, []).append(("antonym", entries[target][0][0]))
+    lines = to_xml(entries, synsets, sense_relations)
+
+    with open(OUTPUT, "w", encoding="utf-8") as lexicon_file:
+        lexicon_file.write("\n".join(lines))
+    print(f"Wrote {len(entries)} entries and {len(synsets)} synsets to {OUTPUT}")
+
+
+if __name__ == "__main__":
+    main()
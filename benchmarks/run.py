@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+run times Wordbook's lookup pipeline offline, against a bundled lexicon.
+
+Everything happens in a temporary directory. The lexicon in data/ is added to
+a fresh wn database there, Wordbook's config, data and cache directories point
+into it, and the espeak-ng stub in stubs/ comes first on PATH. Each benchmark
+reports latency percentiles and throughput.
+
+--save-baseline writes the results as JSON. --compare reads such a file and
+exits with 1 if any benchmark's median got slower by more than --tolerance
+(and by more than NOISE_FLOOR).
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+LEXICON = os.path.join(BENCH_DIR, "data", "bench-lexicon.xml")
+LEXICON_SPECIFIER = "bench:1"
+BASELINE_FORMAT = 1
+
+COMMON_TERMS = ("dog", "good", "bad", "set", "café", "fine", "bace", "cedi", "Fomi", "domestic dog")
+POLYSEMOUS_TERM = "run"
+SEARCH_INPUTS = ("  dog ", '"good"', "(set)", "run!", "<café>", "domestic dog?", "fine\n", "[bace]", "`cedi`", "x")
+PREFIXES = ("b", "ba", "bace", "ce", "d", "do", "fo", "gu", "ka", "le", "r", "se", "zz")
+BATCH_SIZE = 64
+NOISE_FLOOR = 0.01  # ms. Medians closer than this to the baseline are never counted as slower.
+
+
+@dataclass
+class Result:
+    """Timings of one benchmark, in milliseconds per call."""
+
+    name: str
+    calls: int
+    items_per_call: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+    mean: float
+    throughput: float  # items per second
+
+    @classmethod
+    def from_timings(cls, name: str, timings: List[int], items_per_call: int) -> "Result":
+        timings = sorted(timings)
+        total = sum(timings) / 1e9
+
+        def percentile(fraction: float) -> float:
+            return timings[min(len(timings) - 1, math.ceil(fraction * len(timings)) - 1)] / 1e6
+
+        return cls(
+            name=name,
+            calls=len(timings),
+            items_per_call=items_per_call,
+            p50=percentile(0.5),
+            p90=percentile(0.9),
+            p99=percentile(0.99),
+            max=timings[-1] / 1e6,
+            mean=total * 1e3 / len(timings),
+            throughput=len(timings) * items_per_call / total if total else math.inf,
+        )
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], object]
+    setup: Callable[[], object] | None = None
+    items_per_call: int = 1
+
+    def run(self, calls: int, warmup: int) -> Result:
+        for _ in range(warmup):
+            if self.setup is not None:
+                self.setup()
+            self.func()
+        timings = []
+        for _ in range(calls):
+            if self.setup is not None:
+                self.setup()
+            start = time.perf_counter_ns()
+            self.func()
+            timings.append(time.perf_counter_ns() - start)
+        return Result.from_timings(self.name, timings, self.items_per_call)
+
+
+def isolate(workdir: str):
+    """Point Wordbook and espeak-ng at the temporary directory and the stub. Must run before wordbook is imported."""
+    for variable in ("XDG_CONFIG_HOME", "XDG_DATA_HOME", "XDG_CACHE_HOME"):
+        os.environ[variable] = os.path.join(workdir, variable.lower())
+        os.makedirs(os.environ[variable], exist_ok=True)
+    os.environ["PATH"] = os.path.join(BENCH_DIR, "stubs") + os.pathsep + os.environ.get("PATH", "")
+    sys.path.insert(0, REPO_DIR)
+
+
+def load_lexicon(workdir: str):
+    """Add the bundled lexicon to a fresh wn database and open it."""
+    from wordbook import base, espeak, utils
+
+    os.makedirs(utils.DATA_DIR, exist_ok=True)
+    # Always go through the stub, whether or not libespeak-ng happens to be installed.
+    espeak.BACKEND._library_failed = True
+
+    wn = base.import_wn()
+    os.makedirs(os.path.join(workdir, "wn"))
+    wn.config.data_directory = os.path.join(workdir, "wn")
+    wn.add(LEXICON, progress_handler=None)
+    base.WN_DB_VERSION = LEXICON_SPECIFIER
+    return wn.Wordnet(lexicon=LEXICON_SPECIFIER)
+
+
+def make_benchmarks(wn_instance) -> List[Benchmark]:
+    from wordbook import base, render
+
+    lemmas = [word.lemma() for word in wn_instance.words()]
+    completion_index = base.CompletionIndex(lemmas)
+    partial_index = base.PartialCompletionIndex()
+    for start in range(0, len(lemmas), 100):
+        partial_index.add(lemmas[start : start + 100])
+    word_col, sen_col = base.get_colors(False)
+    polysemous_result = base.get_definition(POLYSEMOUS_TERM, wn_instance)[0]["result"]
+    common_result = base.get_definition("good", wn_instance)[0]["result"]
+
+    terms = itertools.cycle(COMMON_TERMS)
+    prefixes = itertools.cycle(PREFIXES)
+    batch_terms = list(itertools.islice(itertools.cycle(lemmas), BATCH_SIZE))
+
+    def cold():
+        base.DEFINITION_CACHE.clear()
+
+    cached_terms = itertools.cycle(COMMON_TERMS)
+    cached_term = [next(cached_terms)]
+
+    def warm():
+        cached_term[0] = next(cached_terms)
+        base.get_definition(cached_term[0], wn_instance)
+
+    return [
+        Benchmark(
+            "clean_search_terms",
+            lambda: [base.clean_search_terms(text) for text in SEARCH_INPUTS],
+            items_per_call=len(SEARCH_INPUTS),
+        ),
+        Benchmark("get_definition, cold", lambda: base.get_definition(next(terms), wn_instance), setup=cold),
+        Benchmark("get_definition, cached", lambda: base.get_definition(cached_term[0], wn_instance), setup=warm),
+        Benchmark(
+            "get_definition, polysemous, cold",
+            lambda: base.get_definition(POLYSEMOUS_TERM, wn_instance),
+            setup=cold,
+        ),
+        Benchmark("get_data, cold", lambda: base.get_data(next(terms), wn_instance), setup=cold),
+        Benchmark("format_output, cold", lambda: base.format_output(next(terms), wn_instance, False), setup=cold),
+        Benchmark(
+            "get_definitions, batch, cold",
+            lambda: list(base.get_definitions(batch_terms, wn_instance, cdef=False)),
+            setup=cold,
+            items_per_call=BATCH_SIZE,
+        ),
+        Benchmark("render_sections", lambda: render.render_sections(common_result, word_col, sen_col)),
+        Benchmark(
+            "render_sections, polysemous",
+            lambda: render.render_sections(polysemous_result, word_col, sen_col),
+        ),
+        Benchmark("CompletionIndex.complete", lambda: completion_index.complete(next(prefixes), limit=10)),
+        Benchmark("PartialCompletionIndex.complete", lambda: partial_index.complete(next(prefixes), limit=10)),
+        Benchmark("CompletionIndex build", lambda: base.CompletionIndex(lemmas), items_per_call=len(lemmas)),
+    ]
+
+
+def compare(results: List[Result], baseline: dict, tolerance: float) -> List[str]:
+    """Describe every benchmark whose median is slower than the baseline's by more than tolerance."""
+    previous = {entry["name"]: entry for entry in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result.name, {}).get("p50", 0)
+        if before > 0:
+            change = result.p50 / before - 1
+            if change > tolerance and result.p50 - before > NOISE_FLOOR:
+                regressions.append(f"{result.name}: median {before:.3f} ms -> {result.p50:.3f} ms (+{change:.0%})")
+    return regressions
+
+
+def print_table(results: List[Result]):
+    width = max(len(result.name) for result in results)
+    print(f"{'benchmark':<{width}}  {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'items/s':>11}")
+    for result in results:
+        print(
+            f"{result.name:<{width}}  {result.p50:9.3f} {result.p90:9.3f} {result.p99:9.3f} {result.max:9.3f}"
+            f" {result.throughput:11.0f}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Wordbook's lookup pipeline offline.")
+    parser.add_argument("--calls", type=int, default=200, help="timed calls per benchmark (default: 200)")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed calls before timing (default: 10)")
+    parser.add_argument("--only", action="append", default=[], help="run benchmarks whose name contains this")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results to FILE as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a baseline saved earlier")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed slowdown of a median, as a fraction (default: 0.25)"
+    )
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="wordbook-bench-")
+    try:
+        isolate(workdir)
+        wn_instance = load_lexicon(workdir)
+        benchmarks = [
+            benchmark
+            for benchmark in make_benchmarks(wn_instance)
+            if not args.only or any(only in benchmark.name for only in args.only)
+        ]
+        results = [benchmark.run(args.calls, args.warmup) for benchmark in benchmarks]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+
+    if args.save_baseline:
+        baseline = {
+            "format": BASELINE_FORMAT,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "calls": args.calls,
+            "results": [asdict(result) for result in results],
+        }
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"\nSaved the baseline to {args.save_baseline}.")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nSlower than the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo benchmark got more than {args.tolerance:.0%} slower than {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,38 +6,73 @@
 base is a part of Wordbook and has code independent from the UI.
 """
 
-import difflib
+import heapq
 import html
 import json
+import mmap
 import os
+import struct
 import subprocess
+import sqlite3
 import sys
-from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future
+from functools import lru_cache, wraps
 from shutil import rmtree
-from typing import Callable, Dict, List
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Sequence, Tuple
 
-import wn
-from wn import Form, Wordnet
+from gi.repository import Gio, GLib
 
-from wordbook import utils
+from wordbook import espeak, queries, tracing, utils
+from wordbook.cache import DefinitionCache, PronunciationStore
+from wordbook.cdef import CustomDefinitionStore
+from wordbook.fuzzy import FuzzyIndex, closest_match
+from wordbook.scheduler import TASKS, Priority
 
-POOL = ThreadPoolExecutor()
+if TYPE_CHECKING:
+    from wn import Wordnet
+
+LOOKUP_BATCH_SIZE = 200
+WARMUP_BATCH_SIZE = 8
+PRONUNCIATION_WARMUP_BATCH_SIZE = 200
+INDEX_CHUNK_SIZE = 20000
 WN_DB_VERSION = "oewn:2022"
-wn.config.data_directory = os.path.join(utils.WN_DIR)
-wn.config.allow_multithreading = True
+WORDLIST_SNAPSHOT = os.path.join(utils.WN_DIR, "wordlist.snapshot")
+FUZZY_INDEX = os.path.join(utils.WN_DIR, "fuzzy.index")
+DEFINITION_CACHE = DefinitionCache()
+PRONUNCIATION_STORE = PronunciationStore()
+
+
+@lru_cache(maxsize=None)
+def import_wn():
+    """
+    Import wn and point it at Wordbook's data.
+
+    Importing wn takes a while, so it's put off until WordNet is first needed
+    instead of holding up the window.
+    """
+    import wn
 
+    wn.config.data_directory = os.path.join(utils.WN_DIR)
+    wn.config.allow_multithreading = True
+    return wn
 
-def _threadpool(func):
+
+def _threadpool(priority: Priority):
     """
-    Wraps around a function allowing it to run in a separate thread and
-    return a future object.
+    Wraps around a function allowing it to run as a task of the given priority
+    and return a future object.
     """
 
-    def wrap(*args, **kwargs):
-        return (POOL).submit(func, *args, **kwargs)
+    def decorator(func):
+        @wraps(func)
+        def wrap(*args, **kwargs):
+            return TASKS.submit(priority, func, *args, **kwargs)
+
+        return wrap
 
-    return wrap
+    return decorator
 
 
 def clean_search_terms(search_term):
@@ -55,11 +90,64 @@ def create_required_dirs():
     os.makedirs(utils.CDEF_DIR, exist_ok=True)  # create Custom Definitions folder.
 
 
-def fetch_definition(text, wordcol, sencol, wn_instance, cdef=True, accent="us"):
+def fetch_definition(text, wn_instance, cdef=True, accent="us", token=None):
     """Check if custom definition exists."""
-    if cdef and os.path.isfile(f"{utils.CDEF_DIR}/{text.lower()}"):
-        return get_custom_def(text, wordcol, sencol, wn_instance, accent)
-    return get_data(text, wordcol, sencol, wn_instance, accent)
+    entry = fetch_entry(text, wn_instance, cdef, token)
+    if token is not None:
+        token.raise_if_cancelled()
+    return _add_pronunciation(entry, text, accent)
+
+
+def fetch_entry(text, wn_instance, cdef=True, token=None):
+    """
+    Do what fetch_definition does, except for looking up the pronunciation.
+
+    The pronunciation is None unless a custom definition provides one.
+    """
+    with tracing.span("cdef check"):
+        is_custom = cdef and text in CUSTOM_DEFINITIONS
+    if is_custom:
+        return get_custom_entry(text, wn_instance, token)
+    return get_entry(text, wn_instance, token)
+
+
+def fetch_definition_staged(text, wn_instance, cdef=True, accent="us", token=None) -> Tuple[Future, Future]:
+    """
+    Run fetch_definition as two interactive tasks, the entry and its pronunciation.
+
+    Returns a future for what fetch_entry gives and one for the pronunciation.
+    The pronunciation of text is started alongside the entry and only looked up
+    again if the entry turns out to be for a different term, so espeak-ng
+    never holds up the definition.
+    """
+    entry_future = TASKS.submit(Priority.INTERACTIVE, fetch_entry, text, wn_instance, cdef, token)
+    text_pron_future = TASKS.submit(Priority.INTERACTIVE, get_pronunciation, text, accent)
+    pron_future: Future = Future()
+    pron_future.set_running_or_notify_cancel()
+
+    def on_pronunciation(future: Future):
+        try:
+            pron_future.set_result(_clean_pronunciation(future.result()))
+        except Exception as ex:
+            pron_future.set_exception(ex)
+
+    def on_entry(future: Future):
+        try:
+            entry = future.result()
+        except BaseException as ex:
+            pron_future.set_exception(ex)
+            return
+        if entry["pronunciation"] is not None:
+            pron_future.set_result(_clean_pronunciation(entry["pronunciation"]))
+        elif (entry["term"] or text) == text:
+            text_pron_future.add_done_callback(on_pronunciation)
+        else:
+            TASKS.submit(Priority.INTERACTIVE, get_pronunciation, entry["term"], accent).add_done_callback(
+                on_pronunciation
+            )
+
+    entry_future.add_done_callback(on_entry)
+    return entry_future, pron_future
 
 
 def get_cowfortune():
@@ -83,56 +171,213 @@ def get_cowfortune():
         return f"<tt>{fortune_out}</tt>"
 
 
-def get_custom_def(text: str, wordcol: str, sencol: str, wn_instance, accent="us"):
-    """Present custom definition when available."""
-    with open(f"{utils.CDEF_DIR}/{text}", "r") as def_file:
-        custom_def_dict: dict = json.load(def_file)
-    if "linkto" in custom_def_dict:
-        return get_data(custom_def_dict.get("linkto", text), wordcol, sencol, wn_instance, accent)
-    definition = custom_def_dict.get(
-        "out_string",
-        get_definition(text, wordcol, sencol, wn_instance)[0]["out_string"],
-    )
-    definition = definition.format(WORDCOL=wordcol, SENCOL=sencol)
-    term = custom_def_dict.get("term", text)
-    pronunciation = custom_def_dict.get("pronunciation", get_pronunciation(term, accent)) or "Is espeak-ng installed?"
+def get_custom_def(text: str, wn_instance, accent="us", token=None):
+    """
+    Present custom definition when available.
+
+    The definition is returned as out_template, with {WORDCOL} and {SENCOL}
+    left in for render_template to fill in.
+    """
+    return _add_pronunciation(get_custom_entry(text, wn_instance, token), text, accent)
+
+
+def get_custom_entry(text: str, wn_instance, token=None):
+    """Do what get_custom_def does, leaving the pronunciation as None if the file doesn't provide one."""
+    text, custom_def_dict = CUSTOM_DEFINITIONS.resolve(text)
+    if custom_def_dict is None:
+        return get_entry(text, wn_instance, token)
+
+    # Only fall back to WordNet for what the file doesn't provide.
+    result = lookup = None
+    if "out_string" not in custom_def_dict:
+        result = get_definition(text, wn_instance, token)[0]["result"]
+        lookup = text
     final_data = {
-        "term": term,
-        "pronunciation": pronunciation,
-        "out_string": definition,
+        "term": custom_def_dict.get("term", text),
+        "lookup": lookup,
+        "pronunciation": custom_def_dict.get("pronunciation"),
+        "result": result,
+        "out_string": None,
+        "out_template": custom_def_dict.get("out_string"),
     }
     return final_data
 
 
-def get_data(term, word_col, sen_col, wn_instance, accent="us"):
+def get_data(term, wn_instance, accent="us", token=None):
     """Obtain the data to be processed and presented."""
+    entry = get_entry(term, wn_instance, token)
+    if token is not None:
+        token.raise_if_cancelled()
+    return _add_pronunciation(entry, term, accent)
+
+
+def get_entry(term, wn_instance, token=None):
+    """Do what get_data does, leaving the pronunciation as None."""
 
     # Obtain definition from given parameters
-    definition = get_definition(term, word_col, sen_col, wn_instance)
-    clean_def = definition[0]
+    definition = get_definition(term, wn_instance, token)
+    return _entry(definition[0], term)
 
-    # Get pronunciation of the term or default to the original term if no pronunciation available.
-    pron = get_pronunciation(clean_def["term"] or term, accent)
-    final_pron = pron if pron and not pron.isspace() else "Is espeak-ng installed?"
 
-    # Create the dictionary to be returned.
+def _entry(clean_def: dict, lookup: str) -> dict:
+    """Create the dictionary that get_entry returns. lookup is the term the WordNet result is for."""
     final_data = {
         "term": clean_def["term"],
-        "pronunciation": final_pron,
+        "lookup": lookup,
+        "pronunciation": None,
         "result": clean_def["result"],
         "out_string": clean_def["out_string"],
     }
-
     return final_data
 
 
-def get_definition(term: str, word_col: str, sen_col: str, wn_instance):
-    """Get the definition from python-wn and process it."""
+def _add_pronunciation(entry: dict, text: str, accent="us") -> dict:
+    """Look up the pronunciation of an entry's term, or of text if it has none, unless it's already known."""
+    if entry["pronunciation"] is None:
+        entry["pronunciation"] = get_pronunciation(entry["term"] or text, accent)
+    entry["pronunciation"] = _clean_pronunciation(entry["pronunciation"])
+    return entry
+
+
+def _clean_pronunciation(pron: str) -> str:
+    return pron if pron and not pron.isspace() else "Is espeak-ng installed?"
+
+
+def get_definitions(terms: Iterable[str], wn_instance, cdef=True, accent="us"):
+    """
+    Look up several terms, yielding (term, data) pairs as they're ready.
+
+    data is what fetch_definition gives for the term. Duplicates are looked up
+    once. Everything but custom definitions is fetched for a batch of terms at
+    a time, with grouped WordNet queries and a single espeak-ng round trip.
+    """
+    lexicon_specifiers = [lexicon.specifier() for lexicon in wn_instance.lexicons()]
+    seen = set()
+    batch = []
+    for term in terms:
+        if term in seen or not term or term.isspace():
+            continue
+        seen.add(term)
+        if cdef and term in CUSTOM_DEFINITIONS:
+            yield term, get_custom_def(term, wn_instance, accent)
+            continue
+        batch.append(term)
+        if len(batch) >= LOOKUP_BATCH_SIZE:
+            yield from _get_data_many(batch, wn_instance, lexicon_specifiers, accent)
+            batch = []
+    if batch:
+        yield from _get_data_many(batch, wn_instance, lexicon_specifiers, accent)
+
+
+def _get_data_many(terms: List[str], wn_instance, lexicon_specifiers: List[str], accent):
+    """Do what get_data does for a batch of terms."""
+    looked_up = _lookup_definitions_many(terms, wn_instance, lexicon_specifiers)
+    entries = {term: _entry(_present_definition(term, looked_up[term])[0], term) for term in terms}
+    prons = get_pronunciations([entry["term"] or term for term, entry in entries.items()], accent)
+    for term, entry in entries.items():
+        entry["pronunciation"] = _clean_pronunciation(prons[entry["term"] or term])
+        yield term, entry
+
+
+def _lookup_definitions_many(terms: List[str], wn_instance, lexicon_specifiers: List[str]) -> Dict[str, dict]:
+    """Get the cached lookups of a batch of terms, looking up and caching the ones that are missing."""
+    lexicon = " ".join(lexicon_specifiers)
+    looked_up = {}
+    missing = []
+    for term in terms:
+        cached = DEFINITION_CACHE.get(lexicon, term)
+        if cached is None:
+            missing.append(term)
+        else:
+            looked_up[term] = cached
+
+    if missing:
+        try:
+            records = queries.find_synset_records_many(missing, lexicon_specifiers)
+        except sqlite3.Error:
+            utils.log_warning("Bulk WordNet query failed, walking python-wn objects instead.")
+            records = {term: _walk_synset_records(term, wn_instance) for term in missing}
+        for term in missing:
+            looked_up[term] = _assemble_definition(term, records[term])
+            DEFINITION_CACHE.set(lexicon, term, looked_up[term])
+    return looked_up
+
+
+def warm_definitions(terms: Sequence[str], wn_instance, token=None) -> List[str]:
+    """
+    Make sure the definitions of terms are in the definition cache.
+
+    Terms are looked up a few at a time so that cancelling the token stops
+    the work quickly. Returns the terms that were warmed.
+    """
+    lexicon_specifiers = [lexicon.specifier() for lexicon in wn_instance.lexicons()]
+    warmed = []
+    for start in range(0, len(terms), WARMUP_BATCH_SIZE):
+        if token is not None and token.cancelled:
+            break
+        batch = list(terms[start : start + WARMUP_BATCH_SIZE])
+        _lookup_definitions_many(batch, wn_instance, lexicon_specifiers)
+        warmed.extend(batch)
+    return warmed
+
+
+def get_definition(term: str, wn_instance, token=None):
+    """
+    Get the definition from the cache or python-wn and process it.
+
+    If a cancellation token is given, the lookup raises LookupCancelled
+    between its queries once it's cancelled. A lookup that has fetched
+    everything is cached before that, since the work is already done.
+    """
+    lexicon_specifiers = [lexicon.specifier() for lexicon in wn_instance.lexicons()]
+    lexicon = " ".join(lexicon_specifiers)
+    with tracing.span("definition cache", term=term):
+        cached = DEFINITION_CACHE.get(lexicon, term)
+    if cached is None:
+        cached = _lookup_definition(term, wn_instance, lexicon_specifiers, token)
+        with tracing.span("definition cache store", term=term):
+            DEFINITION_CACHE.set(lexicon, term, cached)
+        if token is not None:
+            token.raise_if_cancelled()
+    return _present_definition(term, cached)
+
+
+def _present_definition(term: str, cached: dict):
+    """Turn a cached lookup into what get_definition returns."""
+    if cached["result"] is None:
+        clean_def = {
+            "term": term,
+            "result": None,
+            "out_string": None,
+        }
+        return (clean_def, True)
+
+    clean_def = {
+        "term": cached["term"],
+        "result": cached["result"],
+        "out_string": None,
+    }
+    return (clean_def, False)
+
+
+def _lookup_definition(term: str, wn_instance, lexicon_specifiers: List[str], token=None) -> dict:
+    """Collect everything that's presented for a term from WordNet."""
+    try:
+        records = queries.find_synset_records(term, lexicon_specifiers, token)
+    except sqlite3.Error:
+        utils.log_warning("Bulk WordNet query failed, walking python-wn objects instead.")
+        with tracing.span("python-wn walk", term=term):
+            records = _walk_synset_records(term, wn_instance, token)
+    with tracing.span("assemble", term=term):
+        return _assemble_definition(term, records)
+
+
+def _assemble_definition(term: str, records: List[queries.SynsetRecord]) -> dict:
+    """Organize the synset records of a term by part of speech."""
     first_match = None
     result_dict = None
-    synsets = wn_instance.synsets(term)  # Get relevant synsets.
 
-    if synsets:
+    if records:
         # Synsets have 'parts of speech'. We need their real names.
         # We also need to track their values across synsets to an extent.
         pos = None
@@ -159,68 +404,60 @@ def get_definition(term: str, word_col: str, sen_col: str, wn_instance):
             "adposition": [],
             "other": [],
             "unknown": [],
-            "word_col": word_col,
-            "sen_col": sen_col,
         }
-        for synset in synsets:
+        for record in records:
             # Try to organize based on parts of speech.
-            pos = actual_pos[synset.pos]  # If this fails, nothing beyond it is useful.
+            pos = actual_pos[record.pos]  # If this fails, nothing beyond it is useful.
 
             # We need the term as is found in the WordNet database.
-            lemma_names = synset.lemmas()
-            diff_match = difflib.get_close_matches(term, lemma_names)
-            synset_name = diff_match[0].strip() if diff_match else lemma_names[0]
+            synset_name = closest_match(term, record.lemmas).strip()
 
             # If suitable term isn't found, return the term entered.
             if first_match is None or first_match == "":
                 first_match = synset_name
 
             syn = []  # Synonyms
-            ant = []  # Antonyms
-            for lemma in synset.lemmas():
+            for lemma in record.lemmas:
                 syn_name = lemma.replace("_", " ").strip()
                 if not syn_name == first_match:
                     syn.append(syn_name)
-            for sense in synset.senses():
-                for ant_sense in sense.get_related("antonym"):
-                    ant_name = ant_sense.word().lemma()
-                    ant.append(ant_name)
-
-            sims = []  # WordNet's "Similar to"
-            for sim_synset in synset.get_related("similar"):
-                sims.extend(sim_synset.lemmas())
-
-            also_sees = []  # WorNet's "Also See"
-            for also_synset in synset.get_related("also"):
-                also_sees.extend(also_synset.lemmas())
 
             synset_dict = {
                 "name": synset_name,
-                "definition": synset.definition(),
-                "examples": synset.examples(),
+                "definition": record.definition,
+                "examples": record.examples,
                 "syn": syn,
-                "ant": ant,
-                "sim": sims,
-                "also_sees": also_sees,
+                "ant": record.antonyms,
+                "sim": record.similar,  # WordNet's "Similar to"
+                "also_sees": record.also,  # WordNet's "Also See"
             }
 
             # Get the definition for each synset.
             result_dict[pos].append(synset_dict)
 
-    if result_dict is None:
-        clean_def = {
-            "term": term,
-            "result": None,
-            "out_string": None,
-        }
-        return (clean_def, True)
+    return {"term": first_match, "result": result_dict}
 
-    clean_def = {
-        "term": first_match,
-        "result": result_dict,
-        "out_string": None,
-    }
-    return (clean_def, False)
+
+def _walk_synset_records(term: str, wn_instance, token=None) -> List[queries.SynsetRecord]:
+    """Collect synset records by walking python-wn objects, one query at a time."""
+    records = []
+    for synset in wn_instance.synsets(term):
+        if token is not None:
+            token.raise_if_cancelled()
+        records.append(
+            queries.SynsetRecord(
+                pos=synset.pos,
+                lemmas=synset.lemmas(),
+                definition=synset.definition(),
+                examples=synset.examples(),
+                antonyms=[
+                    ant_sense.word().lemma() for sense in synset.senses() for ant_sense in sense.get_related("antonym")
+                ],
+                similar=[lemma for sim_synset in synset.get_related("similar") for lemma in sim_synset.lemmas()],
+                also=[lemma for also_synset in synset.get_related("also") for lemma in also_synset.lemmas()],
+            )
+        )
+    return records
 
 
 def get_fortune(mono=True):
@@ -242,22 +479,34 @@ def get_fortune(mono=True):
     return fortune_output
 
 
-@lru_cache(maxsize=128)
+@lru_cache(maxsize=1024)
 def get_pronunciation(term, accent="us"):
-    """Get the pronunciation from espeak and process it."""
-    pron_output = (
-        subprocess.Popen(
-            ["espeak-ng", "-v", f"en-{accent}", "--ipa", "-q", term],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        .communicate()[0]
-        .decode()
-    )
-    clean_output = " /{0}/".format(pron_output.strip().replace("\n ", " "))
+    """Get the pronunciation from the pronunciation store or espeak and process it."""
+    pron_output = PRONUNCIATION_STORE.get(accent, term)
+    if pron_output is None:
+        with tracing.span("espeak-ng", term=term):
+            pron_output = espeak.text_to_ipa(term, accent)
+        if pron_output:
+            PRONUNCIATION_STORE.set(accent, term, pron_output)
+    if not pron_output:
+        return ""
+    clean_output = " /{0}/".format(pron_output)
     return clean_output
 
 
+def get_pronunciations(terms: Sequence[str], accent="us") -> Dict[str, str]:
+    """Get the pronunciations of several terms like get_pronunciation does, in one espeak-ng round trip."""
+    terms = list(dict.fromkeys(terms))
+    stored = PRONUNCIATION_STORE.get_many(accent, terms)
+    missing = [term for term in terms if term not in stored]
+    if missing:
+        with tracing.span("espeak-ng", terms=len(missing)):
+            transcriptions = dict(zip(missing, espeak.texts_to_ipa(missing, accent)))
+        PRONUNCIATION_STORE.set_many(accent, {term: ipa for term, ipa in transcriptions.items() if ipa})
+        stored.update(transcriptions)
+    return {term: f" /{stored[term]}/" if stored[term] else "" for term in terms}
+
+
 def get_version_info(version):
     """Present clear version info."""
     print(f"Wordbook - {version}")
@@ -274,30 +523,96 @@ def get_version_info(version):
         print(f"You're missing a few dependencies. (espeak-ng)\n{str(ex)}")
 
 
-@_threadpool
-def get_wn_file(reloader: Callable) -> Dict[str, Wordnet | List[Form]]:
-    """Get the WordNet wordlist according to WordNet version."""
+@_threadpool(Priority.COMPLETION)
+def get_fuzzy_index(terms: Sequence[str]) -> FuzzyIndex:
+    """Load the typo-tolerant index for the wordlist, building and saving it if needed."""
+    stamp = f"{WN_DB_VERSION}:{WordlistSnapshot.db_mtime()}"
+    fuzzy_index = FuzzyIndex.load(FUZZY_INDEX, terms, stamp)
+    if fuzzy_index is None:
+        utils.log_info("Building the fuzzy index.")
+        fuzzy_index = FuzzyIndex.build(terms)
+        try:
+            fuzzy_index.write(FUZZY_INDEX, stamp)
+        except OSError:
+            utils.log_warning("Couldn't write the fuzzy index.")
+    utils.log_info("Fuzzy index is ready.")
+    return fuzzy_index
+
+
+@_threadpool(Priority.INTERACTIVE)
+def get_wn_instance(reloader: Callable) -> "Wordnet | None":
+    """Open WordNet, which is all a lookup needs."""
+    wn = import_wn()
     utils.log_info("Initializing WordNet.")
     try:
-        wn_instance: Wordnet = Wordnet(lexicon=WN_DB_VERSION)
+        wn_instance: Wordnet = wn.Wordnet(lexicon=WN_DB_VERSION)
     except (wn.Error, wn.DatabaseError):
         utils.log_info("The WordNet database is either corrupted or is of an older version.")
         return reloader()
-    utils.log_info("Fetching WordNet, wordlist.")
-    wn_file = [w.lemma() for w in wn_instance.words()]
     utils.log_info("WordNet is ready.")
-    return {"instance": wn_instance, "list": wn_file}
+    return wn_instance
+
+
+@_threadpool(Priority.COMPLETION)
+def get_wn_index(wn_instance: "Wordnet", partial: "PartialCompletionIndex | None" = None) -> "CompletionIndex":
+    """
+    Get the completion index of the WordNet wordlist according to WordNet version.
+
+    If the wordlist has to be read from the database, partial is filled in as
+    it's read so that completions can be offered in the meantime. It's
+    finished with the full index either way.
+    """
+    snapshot = WordlistSnapshot.load(WORDLIST_SNAPSHOT)
+    if snapshot is not None:
+        utils.log_info("Using WordNet wordlist snapshot.")
+        wn_index = CompletionIndex.from_sorted(snapshot)
+    else:
+        utils.log_info("Fetching WordNet wordlist.")
+        lemmas = []
+        try:
+            lexicon_specifiers = [lexicon.specifier() for lexicon in wn_instance.lexicons()]
+            for chunk in queries.iter_lemmas(lexicon_specifiers, INDEX_CHUNK_SIZE):
+                lemmas.extend(chunk)
+                if partial is not None:
+                    partial.add(chunk)
+        except sqlite3.Error:
+            utils.log_warning("Couldn't read the wordlist directly, falling back to python-wn.")
+            lemmas = [w.lemma() for w in wn_instance.words()]
+        wn_index = CompletionIndex(lemmas)
+        try:
+            WordlistSnapshot.write(WORDLIST_SNAPSHOT, wn_index.terms)
+        except OSError:
+            utils.log_warning("Couldn't write the WordNet wordlist snapshot.")
+    if partial is not None:
+        partial.finish(wn_index)
+    utils.log_info("WordNet wordlist is ready.")
+    return wn_index
 
 
-def format_output(text, dark_font, wn_instance, cdef, accent="us"):
-    """Return appropriate definitions."""
+def get_colors(dark_font) -> tuple:
+    """Get the (word, sentence) colors to render definitions with."""
     if dark_font:
         sencol = "cyan"  # Color of sentences in Dark mode
         wordcol = "lightgreen"  # Color of: Similar words, Synonyms and Antonyms.
     else:
         sencol = "blue"  # Color of sentences in regular
         wordcol = "green"  # Color of: Similar words, Synonyms, Antonyms.
+    return wordcol, sencol
+
+
+def render_template(template: str, dark_font) -> str:
+    """Fill in the colors of a custom definition."""
+    wordcol, sencol = get_colors(dark_font)
+    return template.format(WORDCOL=wordcol, SENCOL=sencol)
 
+
+def format_output(text, wn_instance, cdef, accent="us", token=None):
+    """
+    Return appropriate definitions.
+
+    The result doesn't depend on the theme. Colors are only added when the
+    result is rendered, so switching themes doesn't need another lookup.
+    """
     if text == "fortune -a":
         return {
             "term": "<tt>Some random adage</tt>",
@@ -313,18 +628,426 @@ def format_output(text, dark_font, wn_instance, cdef, accent="us"):
     if text in ("crash now", "close now"):
         return sys.exit()
     if text and not text.isspace():
-        return fetch_definition(text, wordcol, sencol, wn_instance, cdef=cdef, accent=accent)
+        return fetch_definition(text, wn_instance, cdef=cdef, accent=accent, token=token)
     return None
 
 
+def format_output_staged(text, wn_instance, cdef, accent="us", token=None) -> Tuple[Future, Future] | None:
+    """
+    Do what format_output does, with the entry and its pronunciation as separate stages.
+
+    Returns futures like fetch_definition_staged does, or None if there's nothing to look up.
+    """
+    if text in ("fortune -a", "cowfortune", "crash now", "close now") or not text or text.isspace():
+        output = format_output(text, wn_instance, cdef, accent, token)
+        if output is None:
+            return None
+        entry_future: Future = Future()
+        pron_future: Future = Future()
+        entry_future.set_result(output)
+        pron_future.set_result(output["pronunciation"])
+        return entry_future, pron_future
+    return fetch_definition_staged(text, wn_instance, cdef=cdef, accent=accent, token=token)
+
+
+def warm_pronunciations(terms: Sequence[str], accent="us", stop_event: threading.Event | None = None):
+    """
+    Fill the pronunciation store for terms with warmup tasks, a batch at a time.
+
+    Each batch queues the next one, so searches get ahead of the warmup after
+    every batch. Setting stop_event stops it after the current batch.
+    """
+
+    def warm(start: int):
+        if stop_event is not None and stop_event.is_set():
+            return
+        missing = PRONUNCIATION_STORE.missing(accent, list(terms[start : start + PRONUNCIATION_WARMUP_BATCH_SIZE]))
+        transcriptions = zip(missing, espeak.texts_to_ipa(missing, accent))
+        PRONUNCIATION_STORE.set_many(accent, {term: ipa for term, ipa in transcriptions if ipa})
+        if start + PRONUNCIATION_WARMUP_BATCH_SIZE < len(terms):
+            TASKS.submit(Priority.WARMUP, warm, start + PRONUNCIATION_WARMUP_BATCH_SIZE)
+        else:
+            utils.log_info(f"Pronunciations for {len(terms)} terms are ready.")
+
+    TASKS.submit(Priority.WARMUP, warm, 0)
+
+
 def read_term(text, speed=120, accent="us"):
     """Say text loudly."""
-    with open(os.devnull, "w") as null_maker:
-        subprocess.Popen(
-            ["espeak-ng", "-s", str(speed), "-v", f"en-{accent}", text],
-            stdout=null_maker,
-            stderr=subprocess.STDOUT,
-        )
+    espeak.speak(text, speed=speed, accent=accent)
+
+
+class CompletionIndex:
+    """
+    Sorted, case-folded index of terms for prefix completion.
+
+    Terms are stored once, sorted by their folded key, so a prefix lookup is a
+    binary search followed by a short forward scan instead of a walk over the
+    whole wordlist.
+    """
+
+    def __init__(self, terms=()):
+        """Build the index from an iterable of terms."""
+        unique_terms = {term.replace("_", " ").strip() for term in terms}
+        unique_terms.discard("")
+        self._terms: Sequence[str] = sorted(unique_terms, key=lambda term: (self.fold(term), term))
+        self._keys: Sequence[str] = [self.fold(term) for term in self._terms]
+
+    def __len__(self):
+        return len(self._terms)
+
+    @classmethod
+    def from_sorted(cls, terms: Sequence[str]) -> "CompletionIndex":
+        """
+        Wrap terms that are already unique and in index order without copying them.
+
+        Keys are folded on access, which keeps a memory-mapped snapshot lazy.
+        """
+        index = cls()
+        index._terms = terms
+        index._keys = _FoldedTerms(terms)
+        return index
+
+    @property
+    def terms(self) -> Sequence[str]:
+        """All indexed terms, in index order."""
+        return self._terms
+
+    @staticmethod
+    def fold(term: str) -> str:
+        """Return the key a term is indexed under."""
+        return term.replace("_", " ").casefold()
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Return up to limit terms starting with prefix, in case-insensitive order."""
+        key = self.fold(prefix)
+        completions = []
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and len(completions) < limit and self._keys[i].startswith(key):
+            completions.append(self._terms[i])
+            i += 1
+        return completions
+
+
+class PartialCompletionIndex:
+    """
+    Completion index that can be used while the wordlist is still being read.
+
+    Chunks of terms are indexed as they're added and completions are merged
+    from all of them. Once finished, it hands everything to the full index.
+    """
+
+    def __init__(self):
+        self._chunks: Tuple[CompletionIndex, ...] = ()
+        self._index: CompletionIndex | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self._index is not None
+
+    @property
+    def terms(self) -> Sequence[str]:
+        """The terms indexed so far, in no particular order until finished."""
+        if self._index is not None:
+            return self._index.terms
+        return [term for chunk in self._chunks for term in chunk.terms]
+
+    def add(self, terms: Iterable[str]):
+        """Index another chunk of terms."""
+        self._chunks = self._chunks + (CompletionIndex(terms),)
+
+    def finish(self, index: CompletionIndex):
+        """Switch over to the full index."""
+        self._index = index
+        self._chunks = ()
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Return up to limit terms starting with prefix, like CompletionIndex.complete does."""
+        if self._index is not None:
+            return self._index.complete(prefix, limit)
+        completions = []
+        chunk_completions = (chunk.complete(prefix, limit) for chunk in self._chunks)
+        for term in heapq.merge(*chunk_completions, key=lambda term: (CompletionIndex.fold(term), term)):
+            if not completions or completions[-1] != term:
+                completions.append(term)
+                if len(completions) >= limit:
+                    break
+        return completions
+
+
+class CustomDefinitionIndex:
+    """
+    Index of the custom definitions in a directory and the packed store, by case-folded name.
+
+    The directory is scanned once, on first use, and kept current afterwards by
+    a Gio.FileMonitor once watch() has been called. Definitions in the packed
+    store take precedence over files of the same name. While the directory is
+    watched, where each term's linkto chain ends is remembered until a file
+    changes.
+    """
+
+    def __init__(self, directory: str = utils.CDEF_DIR, store: CustomDefinitionStore | None = None):
+        self.directory = directory
+        self.store = store if store is not None else CustomDefinitionStore()
+        self._lock = threading.Lock()
+        self._paths: Dict[str, str] | None = None
+        self._packed: Dict[str, str] = {}
+        self._completions: CompletionIndex | None = None
+        self._monitor: Gio.FileMonitor | None = None
+        self._parsed: Dict[str, tuple] = {}
+        self._resolved: Dict[str, tuple] = {}
+        self._generation = 0
+
+    def _ensure_loaded(self) -> Dict[str, str]:
+        """Scan the directory if that hasn't happened yet. Must be called with the lock held."""
+        if self._paths is None:
+            self._packed = {name.casefold(): name for name in self.store.names()}
+            self._paths = {}
+            try:
+                with os.scandir(self.directory) as entries:
+                    for entry in sorted(entries, key=lambda entry: entry.name):
+                        if entry.is_file():
+                            self._paths.setdefault(entry.name.casefold(), entry.path)
+            except OSError:
+                utils.log_warning(f"Couldn't read custom definitions from {self.directory}.")
+            self._completions = None
+        return self._paths
+
+    def __contains__(self, term: str) -> bool:
+        with self._lock:
+            return term.casefold() in self._ensure_loaded() or term.casefold() in self._packed
+
+    def get(self, term: str) -> dict | None:
+        """Get the custom definition for term, from the packed store or its file."""
+        with self._lock:
+            path = self._ensure_loaded().get(term.casefold())
+            packed = term.casefold() in self._packed
+        if packed:
+            custom_def_dict = self.store.get(term)
+            if custom_def_dict is not None:
+                return custom_def_dict
+        return self.load(path) if path is not None else None
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Get up to limit custom definition names starting with prefix."""
+        with self._lock:
+            paths = self._ensure_loaded()
+            if self._completions is None:
+                names = {key: os.path.basename(path) for key, path in paths.items()}
+                names.update(self._packed)
+                self._completions = CompletionIndex(names.values())
+            return self._completions.complete(prefix, limit)
+
+    def load(self, path: str) -> dict | None:
+        """Parse the custom definition at path, reusing the last parse while the file is unchanged."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._parsed.pop(path, None)
+            return None
+        cached = self._parsed.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r") as def_file:
+                custom_def_dict = json.load(def_file)
+        except (OSError, ValueError):
+            utils.log_warning(f"Couldn't read the custom definition at {path}.")
+            return None
+        if not isinstance(custom_def_dict, dict):
+            utils.log_warning(f"The custom definition at {path} isn't a JSON object.")
+            return None
+        self._parsed[path] = (mtime, custom_def_dict)
+        return custom_def_dict
+
+    def resolve(self, term: str) -> tuple:
+        """
+        Follow linkto from the custom definition of term.
+
+        Returns the term the chain ends at and its custom definition, or None
+        in its place if the chain leads out of the custom definitions and
+        WordNet should be used instead.
+        """
+        key = term.casefold()
+        with self._lock:
+            resolved = self._resolved.get(key)
+            generation = self._generation
+        if resolved is not None:
+            return resolved
+
+        resolved = self._follow(term)
+        with self._lock:
+            # Without a monitor there's nothing to say when a file changes, so only reuse chains while watching.
+            if self._monitor is not None and generation == self._generation:
+                self._resolved[key] = resolved
+        return resolved
+
+    def _follow(self, term: str) -> tuple:
+        """Do what resolve does, without the cache."""
+        seen = set()
+        while True:
+            custom_def_dict = self.get(term)
+            if custom_def_dict is None or "linkto" not in custom_def_dict:
+                return term, custom_def_dict
+
+            seen.add(term.casefold())
+            link = custom_def_dict["linkto"]
+            if not isinstance(link, str):
+                utils.log_warning(f"The custom definition of '{term}' links to {link!r}, using WordNet for it.")
+                return term, None
+            term = link
+            if term.casefold() in seen:
+                utils.log_warning(f"Custom definitions link back to '{term}', using WordNet for it.")
+                return term, None
+
+    def watch(self):
+        """Start following changes to the directory."""
+        if self._monitor is not None:
+            return
+        directory = Gio.File.new_for_path(self.directory)
+        try:
+            self._monitor = directory.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        except GLib.Error:
+            utils.log_warning(f"Couldn't watch {self.directory} for custom definition changes.")
+            return
+        self._monitor.connect("changed", self._on_changed)
+
+    def _add(self, file: Gio.File):
+        path = file.get_path()
+        if path is not None and os.path.isfile(path):
+            self._paths.setdefault(file.get_basename().casefold(), path)
+
+    def _remove(self, file: Gio.File):
+        name = file.get_basename().casefold()
+        if self._paths.get(name) == file.get_path():
+            del self._paths[name]
+
+    def _on_changed(self, _monitor, file: Gio.File, other_file: Gio.File | None, event: Gio.FileMonitorEvent):
+        """Update the index when a file is added, removed or renamed, and forget resolved links on any change."""
+        with self._lock:
+            self._resolved.clear()
+            self._generation += 1
+            if self._paths is None:
+                return  # Nothing to update, it'll be scanned when needed.
+            if event in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.MOVED_IN):
+                self._add(file)
+            elif event in (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT):
+                self._remove(file)
+            elif event == Gio.FileMonitorEvent.RENAMED:
+                self._remove(file)
+                if other_file is not None:
+                    self._add(other_file)
+            else:
+                return
+            self._completions = None
+
+
+class WordlistSnapshot(Sequence):
+    """
+    Memory-mapped, packed wordlist that survives between launches.
+
+    The file holds a header keyed on the lexicon version and the wn.db
+    modification time, an offsets array and the UTF-8 encoded terms. Terms are
+    only decoded when they're accessed.
+    """
+
+    MAGIC = b"WBWL"
+    FORMAT_VERSION = 1
+    _HEADER = struct.Struct("<4sIqI")
+
+    def __init__(self, buffer: mmap.mmap, offsets: memoryview, data_start: int):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._data_start = data_start
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("snapshot index out of range")
+        start = self._data_start + self._offsets[index]
+        end = self._data_start + self._offsets[index + 1]
+        return self._buffer[start:end].decode("utf-8")
+
+    @staticmethod
+    def db_mtime() -> int:
+        """Get the modification time of the WordNet database, or -1 if it's missing."""
+        try:
+            return os.stat(os.path.join(utils.WN_DIR, "wn.db")).st_mtime_ns
+        except OSError:
+            return -1
+
+    @classmethod
+    def load(cls, path: str) -> "WordlistSnapshot | None":
+        """Map the snapshot at path, or return None if it's missing or stale."""
+        try:
+            with open(path, "rb") as snapshot_file:
+                buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, version, mtime, key_length = cls._HEADER.unpack_from(buffer)
+            position = cls._HEADER.size
+            key = buffer[position : position + key_length].decode("utf-8")
+            position += -(-key_length // 4) * 4  # Keys are padded to keep the offsets aligned.
+            (count,) = struct.unpack_from("<I", buffer, position)
+            position += 4
+            offsets = memoryview(buffer)[position : position + (count + 1) * 4].cast("I")
+        except (struct.error, UnicodeDecodeError, TypeError, ValueError):
+            buffer.close()
+            return None
+
+        if (
+            magic != cls.MAGIC
+            or version != cls.FORMAT_VERSION
+            or key != WN_DB_VERSION
+            or mtime != cls.db_mtime()
+            or len(offsets) != count + 1
+        ):
+            offsets.release()
+            buffer.close()
+            return None
+        return cls(buffer, offsets, position + (count + 1) * 4)
+
+    @classmethod
+    def write(cls, path: str, terms: Sequence[str]):
+        """Pack terms into a snapshot at path for the current database."""
+        encoded_terms = [term.encode("utf-8") for term in terms]
+        offsets = [0]
+        for encoded_term in encoded_terms:
+            offsets.append(offsets[-1] + len(encoded_term))
+        key = WN_DB_VERSION.encode("utf-8")
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as snapshot_file:
+            snapshot_file.write(cls._HEADER.pack(cls.MAGIC, cls.FORMAT_VERSION, cls.db_mtime(), len(key)))
+            snapshot_file.write(key.ljust(-(-len(key) // 4) * 4, b"\0"))
+            snapshot_file.write(struct.pack("<I", len(encoded_terms)))
+            snapshot_file.write(struct.pack(f"<{len(offsets)}I", *offsets))
+            snapshot_file.write(b"".join(encoded_terms))
+        os.replace(temp_path, path)
+
+
+class _FoldedTerms(Sequence):
+    """Read-only view of a term sequence as completion keys."""
+
+    def __init__(self, terms: Sequence[str]):
+        self._terms = terms
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __getitem__(self, index):
+        return CompletionIndex.fold(self._terms[index])
+
+
+CUSTOM_DEFINITIONS = CustomDefinitionIndex()
 
 
 class WordnetDownloader:
@@ -340,9 +1063,11 @@ class WordnetDownloader:
         """Download the Wordnet database."""
         if os.path.isdir(os.path.join(utils.WN_DIR, "downloads")):
             rmtree(os.path.join(utils.WN_DIR, "downloads"))
-        wn.download(WN_DB_VERSION, progress_handler=progress_handler)
+        import_wn().download(WN_DB_VERSION, progress_handler=progress_handler)
+        queries.reset_connections()
 
     @staticmethod
     def delete_db():
         """Delete the Wordnet database."""
+        queries.reset_connections()
         os.remove(os.path.join(utils.WN_DIR, "wn.db"))
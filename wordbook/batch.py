@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+batch looks up lists of terms without the UI.
+
+Terms are read one per line and handed to a pool of worker processes in
+chunks, each worker reading the WordNet database on its own. Results are
+written as JSON Lines in input order, with only a few chunks per worker in
+flight at any time so memory use doesn't grow with the input.
+"""
+
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, TextIO
+
+from wn import Wordnet
+
+from wordbook import base, utils
+from wordbook.cache import BATCH_CACHE_DB, DefinitionCache
+
+CHUNK_SIZE = 64
+CHUNKS_PER_WORKER = 4
+
+_wn_instance: Wordnet | None = None
+
+
+def _init_worker():
+    """Open WordNet once per worker process, with a definition cache of the batch's own."""
+    global _wn_instance
+    base.DEFINITION_CACHE = DefinitionCache(BATCH_CACHE_DB)
+    _wn_instance = base.import_wn().Wordnet(lexicon=base.WN_DB_VERSION)
+
+
+def look_up(term: str, wn_instance: Wordnet, cdef: bool = True, accent: str = "us") -> dict:
+    """Look up a term and return what's written out for it."""
+    data = base.fetch_definition(term, wn_instance, cdef=cdef, accent=accent)
+    return _make_entry(term, data)
+
+
+def _make_entry(term: str, data: dict) -> dict:
+    """Turn what fetch_definition gives for a term into what's written out for it."""
+    result = data.get("result")
+    entry = {
+        "query": term,
+        "term": data["term"] or term,
+        "pronunciation": None,
+        "result": result,
+    }
+    if data.get("out_template") is not None:
+        entry["out_string"] = base.render_template(data["out_template"], dark_font=False)
+    if result is not None or "out_string" in entry:
+        entry["pronunciation"] = data["pronunciation"].strip()
+    return entry
+
+
+def _look_up_chunk(terms: List[str], cdef: bool, accent: str) -> List[str]:
+    """Look up a chunk of terms in a worker, returning one JSON line for each."""
+    entries = {}
+    try:
+        for term, data in base.get_definitions(terms, _wn_instance, cdef=cdef, accent=accent):
+            entries[term] = _make_entry(term, data)
+    except Exception as ex:  # Go term by term to find the bad one instead of failing the whole chunk.
+        utils.log_warning(f"Looking up a chunk of terms failed, retrying them one by one: {ex}")
+
+    lines = []
+    for term in terms:
+        if term not in entries:
+            try:
+                entries[term] = look_up(term, _wn_instance, cdef, accent)
+            except Exception as ex:  # One bad term shouldn't take down the whole batch.
+                utils.log_error(f"Looking up '{term}' failed: {ex}")
+                entries[term] = {"query": term, "error": str(ex)}
+        lines.append(json.dumps(entries[term], ensure_ascii=False))
+    return lines
+
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Group non-empty, stripped lines into lists of up to size terms."""
+    chunk = []
+    for line in lines:
+        term = line.strip()
+        if term:
+            chunk.append(term)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(lines: Iterable[str], output: TextIO, workers: int | None = None, cdef: bool = True, accent: str = "us") -> int:
+    """Look up every term in lines and write the results to output. Returns an exit status."""
+    if not base.WordnetDownloader.check_status():
+        utils.log_error("WordNet hasn't been downloaded yet. Open Wordbook once to set it up.")
+        return 1
+
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+
+    def write_oldest():
+        output.write("".join(f"{line}\n" for line in pending.popleft().result()))
+        output.flush()
+
+    # Workers are spawned rather than forked so they don't inherit GLib's state.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as pool:
+        for chunk in _chunks(lines, CHUNK_SIZE):
+            pending.append(pool.submit(_look_up_chunk, chunk, cdef, accent))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                write_oldest()
+        while pending:
+            write_oldest()
+    return 0
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""cache keeps lookup results around between searches and between sessions."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from wordbook import utils
+
+CACHE_DB = os.path.join(utils.DATA_DIR, "cache.db")
+BATCH_CACHE_DB = os.path.join(utils.DATA_DIR, "batch-cache.db")  # Keeps --batch runs from evicting the UI's lookups.
+
+
+class _SQLiteStore:
+    """Lazily opened SQLite table under DATA_DIR shared by the caches."""
+
+    SCHEMA: tuple = ()
+
+    def __init__(self, path: str = CACHE_DB):
+        """Initialize the store. The database is only opened on first use."""
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection: sqlite3.Connection | None = None
+        self._disk_failed = False
+
+    def _connect(self) -> sqlite3.Connection | None:
+        """Get the database connection, opening it if needed."""
+        if self._connection is None and not self._disk_failed:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=10)
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("PRAGMA synchronous = NORMAL")
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+                self._opened(connection)
+                self._connection = connection
+            except sqlite3.Error:
+                utils.log_warning(f"Couldn't open {self.path}, only keeping lookups in memory.")
+                self._disk_failed = True
+        return self._connection
+
+    def _opened(self, connection: sqlite3.Connection):
+        """Called once the database has been opened and the schema is in place."""
+
+
+class DefinitionCache(_SQLiteStore):
+    """
+    Cache of theme-independent WordNet lookups.
+
+    An in-memory LRU sits in front of a SQLite table. Entries are stored as
+    compressed JSON and evicted least recently used first once the table grows
+    beyond max_bytes. The database's user_version holds FORMAT_VERSION, and the
+    table is emptied when it doesn't match.
+    """
+
+    FORMAT_VERSION = 1  # Bump whenever what's cached for a lookup changes shape.
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS definitions ("
+        " lexicon TEXT NOT NULL,"
+        " term TEXT NOT NULL,"
+        " data BLOB NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " last_used REAL NOT NULL,"
+        " PRIMARY KEY (lexicon, term))",
+        "CREATE INDEX IF NOT EXISTS definitions_last_used ON definitions (last_used)",
+    )
+
+    def __init__(self, path: str = CACHE_DB, max_bytes: int = 32 * 1024 * 1024, memory_items: int = 256):
+        """Initialize the cache. The database is only opened on first use."""
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory: OrderedDict = OrderedDict()
+        self._total_bytes = 0
+
+    def _opened(self, connection: sqlite3.Connection):
+        if connection.execute("PRAGMA user_version").fetchone()[0] != self.FORMAT_VERSION:
+            utils.log_info("The definition cache was written by another version of Wordbook, clearing it.")
+            connection.execute("DELETE FROM definitions")
+            connection.execute(f"PRAGMA user_version = {self.FORMAT_VERSION}")
+        self._total_bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM definitions").fetchone()[0]
+
+    def _remember(self, key, value):
+        """Put a value in the in-memory LRU."""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, lexicon: str, term: str) -> dict | None:
+        """Get a cached lookup, or None if the term hasn't been cached."""
+        key = (lexicon, term)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+            connection = self._connect()
+            if connection is None:
+                return None
+            try:
+                row = connection.execute(
+                    "SELECT data FROM definitions WHERE lexicon = ? AND term = ?",
+                    key,
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE definitions SET last_used = ? WHERE lexicon = ? AND term = ?",
+                    (time.time(), *key),
+                )
+                value = json.loads(zlib.decompress(row[0]))
+            except (sqlite3.Error, zlib.error, ValueError):
+                utils.log_warning(f"Couldn't read '{term}' from the definition cache.")
+                return None
+            self._remember(key, value)
+            return value
+
+    def set(self, lexicon: str, term: str, value: dict):
+        """Cache a lookup."""
+        key = (lexicon, term)
+        with self._lock:
+            self._remember(key, value)
+
+            connection = self._connect()
+            if connection is None:
+                return
+            data = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+            try:
+                old_size = connection.execute(
+                    "SELECT size FROM definitions WHERE lexicon = ? AND term = ?",
+                    key,
+                ).fetchone()
+                connection.execute(
+                    "INSERT OR REPLACE INTO definitions (lexicon, term, data, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (*key, data, len(data), time.time()),
+                )
+                self._total_bytes += len(data) - (old_size[0] if old_size else 0)
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+            except sqlite3.Error:
+                utils.log_warning(f"Couldn't write '{term}' to the definition cache.")
+
+    def _evict(self):
+        """Drop the least recently used entries until the cache is back under 90% of its size limit."""
+        target = self.max_bytes * 0.9
+        rows = self._connection.execute("SELECT lexicon, term, size FROM definitions ORDER BY last_used")
+        doomed = []
+        for lexicon, term, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((lexicon, term))
+            self._total_bytes -= size
+        self._connection.executemany("DELETE FROM definitions WHERE lexicon = ? AND term = ?", doomed)
+
+    def clear(self):
+        """Remove everything from the cache."""
+        with self._lock:
+            self._memory.clear()
+            connection = self._connect()
+            if connection is not None:
+                connection.execute("DELETE FROM definitions")
+                self._total_bytes = 0
+
+
+class PronunciationStore(_SQLiteStore):
+    """IPA transcriptions kept on disk per accent and term."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS pronunciations ("
+        " accent TEXT NOT NULL,"
+        " term TEXT NOT NULL,"
+        " ipa TEXT NOT NULL,"
+        " PRIMARY KEY (accent, term)) WITHOUT ROWID",
+    )
+
+    def get(self, accent: str, term: str) -> str | None:
+        """Get a stored transcription, or None if there isn't one."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return None
+            try:
+                row = connection.execute(
+                    "SELECT ipa FROM pronunciations WHERE accent = ? AND term = ?",
+                    (accent, term),
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+            return row[0] if row else None
+
+    def get_many(self, accent: str, terms: list) -> dict:
+        """Get the stored transcriptions of several terms. Terms without one are left out."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return {}
+            known = {}
+            try:
+                for start in range(0, len(terms), utils.SQL_CHUNK_SIZE):
+                    chunk = terms[start : start + utils.SQL_CHUNK_SIZE]
+                    placeholders = ", ".join("?" * len(chunk))
+                    known.update(
+                        connection.execute(
+                            f"SELECT term, ipa FROM pronunciations WHERE accent = ? AND term IN ({placeholders})",
+                            (accent, *chunk),
+                        )
+                    )
+            except sqlite3.Error:
+                utils.log_warning("Couldn't read from the pronunciation store.")
+            return known
+
+    def missing(self, accent: str, terms: list) -> list:
+        """Return the terms that don't have a stored transcription yet."""
+        known = self.get_many(accent, terms)
+        return [term for term in terms if term not in known]
+
+    def set_many(self, accent: str, transcriptions: dict):
+        """Store transcriptions for several terms at once."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+            try:
+                connection.execute("BEGIN")
+                connection.executemany(
+                    "INSERT OR REPLACE INTO pronunciations (accent, term, ipa) VALUES (?, ?, ?)",
+                    ((accent, term, ipa) for term, ipa in transcriptions.items()),
+                )
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                utils.log_warning("Couldn't write to the pronunciation store.")
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+
+    def set(self, accent: str, term: str, ipa: str):
+        """Store the transcription of a term."""
+        self.set_many(accent, {term: ipa})
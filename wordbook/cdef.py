@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+cdef keeps custom definitions packed in a single SQLite file.
+
+This is optional. The store is only created by importing definitions into it,
+and the one-file-per-term folder keeps working alongside it. In JSON Lines
+form, every line is a custom definition object with an extra "name" key for
+the term it's filed under.
+"""
+
+import json
+import os
+import sqlite3
+from typing import Iterable, Iterator, List, Tuple
+
+from wordbook import utils
+from wordbook.cache import _SQLiteStore
+
+CDEF_DB = os.path.join(utils.DATA_DIR, "cdef.db")
+BATCH_SIZE = 1000
+
+
+class CustomDefinitionStore(_SQLiteStore):
+    """Custom definitions by case-folded name, stored as JSON."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS custom_definitions ("
+        " key TEXT NOT NULL PRIMARY KEY,"
+        " name TEXT NOT NULL,"
+        " data TEXT NOT NULL) WITHOUT ROWID",
+    )
+
+    def __init__(self, path: str = CDEF_DB):
+        super().__init__(path)
+
+    def _connect(self, create: bool = False) -> sqlite3.Connection | None:
+        """Get the database connection. It's only created when create is set."""
+        if self._connection is None and not create and not os.path.exists(self.path):
+            return None
+        return super()._connect()
+
+    def names(self) -> List[str]:
+        """Get the names of all stored definitions."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return []
+            try:
+                return [row[0] for row in connection.execute("SELECT name FROM custom_definitions")]
+            except sqlite3.Error:
+                utils.log_warning("Couldn't read the packed custom definitions.")
+                return []
+
+    def get(self, name: str) -> dict | None:
+        """Get the custom definition filed under name, or None if there isn't one."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return None
+            try:
+                row = connection.execute(
+                    "SELECT data FROM custom_definitions WHERE key = ?",
+                    (name.casefold(),),
+                ).fetchone()
+                return json.loads(row[0]) if row else None
+            except (sqlite3.Error, ValueError):
+                utils.log_warning(f"Couldn't read the packed custom definition for '{name}'.")
+                return None
+
+    def put_many(self, entries: Iterable[Tuple[str, dict]]) -> int:
+        """Store (name, definition) pairs, replacing existing ones. Returns how many were stored."""
+        count = 0
+        with self._lock:
+            connection = self._connect(create=True)
+            if connection is None:
+                return 0
+            batch = []
+            try:
+                connection.execute("BEGIN")
+                for name, definition in entries:
+                    batch.append((name.casefold(), name, json.dumps(definition, separators=(",", ":"))))
+                    if len(batch) >= BATCH_SIZE:
+                        count += self._write(connection, batch)
+                count += self._write(connection, batch)
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                utils.log_warning("Couldn't write to the packed custom definitions.")
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                return 0
+        return count
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, batch: list) -> int:
+        connection.executemany("INSERT OR REPLACE INTO custom_definitions (key, name, data) VALUES (?, ?, ?)", batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """Iterate over every stored (name, definition) pair, ordered by name."""
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+            for name, data in connection.execute("SELECT name, data FROM custom_definitions ORDER BY key"):
+                yield name, json.loads(data)
+
+
+def read_directory(path: str) -> Iterator[Tuple[str, dict]]:
+    """Read custom definitions from a folder of per-term files."""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                try:
+                    with open(entry.path, "r") as def_file:
+                        definition = json.load(def_file)
+                except (OSError, ValueError):
+                    utils.log_warning(f"Skipping {entry.path}, it isn't a readable custom definition.")
+                    continue
+                if isinstance(definition, dict):
+                    yield entry.name, definition
+    except OSError as err:
+        utils.log_warning(f"Couldn't read the custom definitions in {path}: {err}")
+
+
+def read_jsonl(path: str) -> Iterator[Tuple[str, dict]]:
+    """Read custom definitions from a JSON Lines file. A file that can't be read or decoded is logged and skipped."""
+    try:
+        with open(path, "r", encoding="utf-8") as jsonl_file:
+            for line_number, line in enumerate(jsonl_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    definition = json.loads(line)
+                    name = definition.pop("name")
+                except (ValueError, KeyError, AttributeError, TypeError):
+                    utils.log_warning(f"Skipping line {line_number} of {path}, it isn't a named custom definition.")
+                    continue
+                yield str(name), definition
+    except (OSError, UnicodeDecodeError) as err:
+        utils.log_warning(f"Couldn't read the custom definitions in {path}: {err}")
+
+
+def import_definitions(source: str, store: CustomDefinitionStore) -> int:
+    """Import custom definitions from a folder or a JSON Lines file. Returns how many were imported."""
+    entries = read_directory(source) if os.path.isdir(source) else read_jsonl(source)
+    return store.put_many(entries)
+
+
+def export_definitions(destination, store: CustomDefinitionStore, legacy_dir: str = utils.CDEF_DIR) -> int:
+    """
+    Write every custom definition to an open text file as JSON Lines.
+
+    Definitions in legacy_dir are included unless the store has one by the
+    same name. Returns how many were written.
+    """
+    count = 0
+    exported = set()
+    for name, definition in store.items():
+        destination.write(json.dumps({**definition, "name": name}, ensure_ascii=False) + "\n")
+        exported.add(name.casefold())
+        count += 1
+    if os.path.isdir(legacy_dir):
+        for name, definition in read_directory(legacy_dir):
+            if name.casefold() not in exported:
+                destination.write(json.dumps({**definition, "name": name}, ensure_ascii=False) + "\n")
+                count += 1
+    return count
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+cli handles the options that don't need the UI.
+
+It runs before the application is built, so --batch, --import-cdef and
+--export-cdef never load GTK or libadwaita and work without a display. The
+options are still registered with the application so that --help lists them.
+"""
+
+import argparse
+import os
+import sys
+
+
+def main(argv, development_mode=False) -> int | None:
+    """Handle a headless option in argv and return an exit status, or None if the UI should start."""
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--batch", metavar="PATH")
+    parser.add_argument("--import-cdef", metavar="PATH")
+    parser.add_argument("--export-cdef", metavar="PATH")
+    options, _rest = parser.parse_known_args(argv[1:])
+    if options.batch is None and options.import_cdef is None and options.export_cdef is None:
+        return None
+
+    from wordbook import base, tracing, utils
+    from wordbook.settings import Settings
+
+    utils.log_init(development_mode or options.verbose)
+    if options.verbose:
+        tracing.TRACER.enable()
+    base.create_required_dirs()
+
+    if options.batch is not None:
+        from wordbook import batch
+
+        cdef_enabled = Settings.get().cdef
+        accent = Settings.get().pronunciations_accent
+        if options.batch == "-":
+            return batch.run(sys.stdin, sys.stdout, cdef=cdef_enabled, accent=accent)
+        try:
+            with open(options.batch, "r") as terms_file:
+                return batch.run(terms_file, sys.stdout, cdef=cdef_enabled, accent=accent)
+        except OSError as err:
+            print(f"Couldn't read terms: {err}", file=sys.stderr)
+            return 1
+
+    from wordbook import cdef
+
+    if options.import_cdef is not None:
+        if not os.path.exists(options.import_cdef):
+            print(f"{options.import_cdef} doesn't exist.", file=sys.stderr)
+            return 1
+        count = cdef.import_definitions(options.import_cdef, base.CUSTOM_DEFINITIONS.store)
+        print(f"Imported {count} custom definitions.", file=sys.stderr)
+        return 0
+
+    try:
+        if options.export_cdef == "-":
+            count = cdef.export_definitions(sys.stdout, base.CUSTOM_DEFINITIONS.store)
+        else:
+            with open(options.export_cdef, "w") as export_file:
+                count = cdef.export_definitions(export_file, base.CUSTOM_DEFINITIONS.store)
+    except OSError as err:
+        print(f"Couldn't export custom definitions: {err}", file=sys.stderr)
+        return 1
+    print(f"Exported {count} custom definitions.", file=sys.stderr)
+    return 0
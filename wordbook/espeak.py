@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+espeak talks to espeak-ng without starting a new process for every term.
+
+IPA is produced by libespeak-ng through ctypes when the library can be loaded,
+otherwise by a long-lived espeak-ng process per accent that terms are streamed
+to. If neither works, a one-off espeak-ng process is used like before.
+"""
+
+import atexit
+import ctypes
+import ctypes.util
+import os
+import random
+import select
+import shutil
+import subprocess
+import threading
+from typing import List
+
+from wordbook import utils
+
+# From espeak-ng's speak_lib.h
+AUDIO_OUTPUT_SYNCHRONOUS = 2
+ESPEAK_CHARS_UTF8 = 1
+ESPEAK_INITIALIZE_DONT_EXIT = 0x8000
+ESPEAK_PHONEMES_IPA = 0x02
+
+MAX_TERM_LENGTH = 900  # bytes of UTF-8. espeak-ng reads at most 1000 bytes per line from stdin.
+WORKER_TIMEOUT = 5  # seconds
+PIPELINE_SIZE = 100  # Terms written to a worker before reading back, small enough not to fill the pipes.
+
+
+def _truncate(text: str) -> bytes:
+    """Encode text as UTF-8, cut down to MAX_TERM_LENGTH bytes without splitting a character."""
+    encoded = text.encode("utf-8")
+    if len(encoded) <= MAX_TERM_LENGTH:
+        return encoded
+    return encoded[:MAX_TERM_LENGTH].decode("utf-8", "ignore").encode("utf-8")
+
+
+class EspeakError(Exception):
+    """Raised when an espeak-ng backend stops working."""
+
+
+class _Library:
+    """IPA transcription through libespeak-ng."""
+
+    def __init__(self):
+        """Load and initialize libespeak-ng, raising EspeakError if that isn't possible."""
+        lib = None
+        for name in ("libespeak-ng.so.1", ctypes.util.find_library("espeak-ng")):
+            if name is None:
+                continue
+            try:
+                lib = ctypes.CDLL(name)
+                break
+            except OSError:
+                continue
+        if lib is None:
+            raise EspeakError("libespeak-ng could not be loaded")
+
+        lib.espeak_Initialize.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        lib.espeak_Initialize.restype = ctypes.c_int
+        lib.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        lib.espeak_SetVoiceByName.restype = ctypes.c_int
+        lib.espeak_TextToPhonemes.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_int, ctypes.c_int]
+        lib.espeak_TextToPhonemes.restype = ctypes.c_char_p
+
+        if lib.espeak_Initialize(AUDIO_OUTPUT_SYNCHRONOUS, 0, None, ESPEAK_INITIALIZE_DONT_EXIT) < 0:
+            raise EspeakError("libespeak-ng could not be initialized")
+
+        self._lib = lib
+        self._lock = threading.Lock()
+        self._voice = None
+
+    def ipa(self, text: str, accent: str) -> str:
+        """Transcribe text to IPA."""
+        with self._lock:
+            if self._voice != accent:
+                if self._lib.espeak_SetVoiceByName(f"en-{accent}".encode()) != 0:
+                    raise EspeakError(f"espeak-ng has no voice for en-{accent}")
+                self._voice = accent
+
+            buffer = ctypes.create_string_buffer(text.encode("utf-8"))
+            text_ptr = ctypes.c_void_p(ctypes.addressof(buffer))
+            clauses = []
+            # Each call transcribes one clause and moves text_ptr along, setting it to NULL at the end.
+            while text_ptr.value:
+                phonemes = self._lib.espeak_TextToPhonemes(
+                    ctypes.byref(text_ptr), ESPEAK_CHARS_UTF8, ESPEAK_PHONEMES_IPA
+                )
+                if phonemes:
+                    clauses.append(phonemes.decode("utf-8").strip())
+            return " ".join(clause for clause in clauses if clause)
+
+
+class _Worker:
+    """A long-lived espeak-ng process reading one line of text at a time from stdin."""
+
+    def __init__(self, args):
+        """Start the process."""
+        self._process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+        self._markers: tuple[str, str] | None = None
+        self._marker_outputs: tuple[str, str] | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def write(self, line: str):
+        """Send a line of text to the process."""
+        try:
+            self._process.stdin.write(_truncate(line.replace("\n", " ")) + b"\n")
+            self._process.stdin.flush()
+        except (BrokenPipeError, ValueError) as ex:
+            raise EspeakError("espeak-ng worker stopped") from ex
+
+    def _readline(self) -> str:
+        """Read a line of output, giving up if the process stops responding."""
+        fd = self._process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            ready, _, _ = select.select([fd], [], [], WORKER_TIMEOUT)
+            chunk = os.read(fd, 4096) if ready else b""
+            if not chunk:
+                self.close()
+                raise EspeakError("espeak-ng worker stopped responding")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode("utf-8", errors="replace").strip()
+
+    def transcribe(self, text: str) -> str:
+        """Send text to an IPA worker and collect everything it prints before the marker that follows it."""
+        return self.transcribe_many([text])[0]
+
+    def _learn_markers(self) -> tuple[str, str]:
+        """
+        Pick the markers written after every term and after every batch, and learn what they come out as.
+
+        They're random numbers, so no lookup term is going to come out the
+        same way by accident.
+        """
+        if self._marker_outputs is None:
+            term_marker, end_marker = (str(number) for number in random.sample(range(10**8, 10**9), 2))
+            self.write(term_marker)
+            self.write(end_marker)
+            outputs = (self._readline(), self._readline())
+            if not all(outputs) or outputs[0] == outputs[1]:
+                self.close()
+                raise EspeakError("espeak-ng worker markers can't be told apart")
+            self._markers, self._marker_outputs = (term_marker, end_marker), outputs
+        return self._marker_outputs
+
+    def transcribe_many(self, texts: List[str]) -> List[str]:
+        """
+        Send several texts to an IPA worker at once, then collect the output for each.
+
+        If the output doesn't line up with the texts, the worker is stopped
+        and EspeakError is raised rather than handing out transcriptions of
+        the wrong terms.
+        """
+        term_output, end_output = self._learn_markers()
+        term_marker, end_marker = self._markers
+
+        for text in texts:
+            self.write(text)
+            self.write(term_marker)
+        self.write(end_marker)
+        transcriptions = []
+        lines = []
+        while (line := self._readline()) != end_output:
+            if line == term_output:
+                transcriptions.append(" ".join(lines))
+                lines = []
+            elif line:
+                lines.append(line)
+        if lines or len(transcriptions) != len(texts):
+            self.close()
+            raise EspeakError("espeak-ng worker output didn't line up with its input")
+        return transcriptions
+
+    def close(self):
+        """Stop the process."""
+        if self.alive:
+            self._process.stdin.close()
+            self._process.terminate()
+
+
+class _Backend:
+    """Picks the fastest available way of running espeak-ng and keeps its workers around."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._library: _Library | None = None
+        self._library_failed = False
+        self._ipa_workers: dict[str, _Worker] = {}
+        self._speakers: dict[tuple[str, str], _Worker] = {}
+        self._has_executable = shutil.which("espeak-ng") is not None
+
+    def _get_library(self) -> _Library | None:
+        if self._library is None and not self._library_failed:
+            try:
+                self._library = _Library()
+            except EspeakError as ex:
+                utils.log_info(f"Using the espeak-ng executable: {ex}")
+                self._library_failed = True
+        return self._library
+
+    def ipa(self, text: str, accent: str) -> str:
+        """Transcribe text to IPA with the best available backend."""
+        library = self._get_library()
+        if library is not None:
+            try:
+                return library.ipa(text, accent)
+            except EspeakError as ex:
+                utils.log_warning(str(ex))
+
+        if self._has_executable:
+            with self._lock:
+                worker = self._ipa_workers.get(accent)
+                try:
+                    if worker is None or not worker.alive:
+                        worker = self._ipa_workers[accent] = _Worker(["espeak-ng", "-v", f"en-{accent}", "--ipa", "-q"])
+                    return worker.transcribe(text)
+                except (OSError, EspeakError) as ex:
+                    utils.log_warning(f"espeak-ng worker failed, falling back to a new process: {ex}")
+                    self._ipa_workers.pop(accent, None)
+
+        return _run_once(text, accent)
+
+    def ipa_many(self, texts: List[str], accent: str) -> List[str]:
+        """Transcribe several texts to IPA, streaming them to a worker in batches if one is used."""
+        if self._get_library() is not None or not self._has_executable:
+            return [self.ipa(text, accent) for text in texts]
+
+        transcriptions = []
+        for start in range(0, len(texts), PIPELINE_SIZE):
+            # The lock is let go between batches so single lookups don't wait for all of them.
+            with self._lock:
+                worker = self._ipa_workers.get(accent)
+                try:
+                    if worker is None or not worker.alive:
+                        worker = self._ipa_workers[accent] = _Worker(["espeak-ng", "-v", f"en-{accent}", "--ipa", "-q"])
+                    transcriptions.extend(worker.transcribe_many(texts[start : start + PIPELINE_SIZE]))
+                except (OSError, EspeakError) as ex:
+                    utils.log_warning(f"espeak-ng worker failed, falling back to new processes: {ex}")
+                    self._ipa_workers.pop(accent, None)
+                    break
+        return transcriptions + [_run_once(text, accent) for text in texts[len(transcriptions) :]]
+
+    def speak(self, text: str, speed: str, accent: str):
+        """Say text out loud through a long-lived espeak-ng process."""
+        with self._lock:
+            key = (str(speed), accent)
+            speaker = self._speakers.get(key)
+            try:
+                if speaker is None or not speaker.alive:
+                    speaker = self._speakers[key] = _Worker(["espeak-ng", "-s", str(speed), "-v", f"en-{accent}"])
+                speaker.write(text)
+                return
+            except (OSError, EspeakError) as ex:
+                utils.log_warning(f"espeak-ng speaker failed, falling back to a new process: {ex}")
+                self._speakers.pop(key, None)
+
+        with open(os.devnull, "w") as null_maker:
+            subprocess.Popen(
+                ["espeak-ng", "-s", str(speed), "-v", f"en-{accent}", text],
+                stdout=null_maker,
+                stderr=subprocess.STDOUT,
+            )
+
+    def close(self):
+        """Stop every worker."""
+        with self._lock:
+            for worker in (*self._ipa_workers.values(), *self._speakers.values()):
+                worker.close()
+            self._ipa_workers.clear()
+            self._speakers.clear()
+
+
+def _run_once(text: str, accent: str) -> str:
+    """Transcribe text to IPA with a one-off espeak-ng process."""
+    try:
+        pron_output = (
+            subprocess.Popen(
+                ["espeak-ng", "-v", f"en-{accent}", "--ipa", "-q", text],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            .communicate()[0]
+            .decode()
+        )
+    except OSError:
+        utils.log_warning("espeak-ng couldn't be run.")
+        return ""
+    return pron_output.strip().replace("\n ", " ")
+
+
+BACKEND = _Backend()
+atexit.register(BACKEND.close)
+
+
+def text_to_ipa(text: str, accent: str = "us") -> str:
+    """Get the IPA transcription of text, without surrounding slashes."""
+    return BACKEND.ipa(text, accent)
+
+
+def texts_to_ipa(texts: List[str], accent: str = "us") -> List[str]:
+    """Get the IPA transcriptions of several texts, in order."""
+    return BACKEND.ipa_many(list(texts), accent)
+
+
+def speak(text: str, speed="120", accent: str = "us"):
+    """Say text out loud."""
+    BACKEND.speak(text, speed, accent)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+fuzzy finds terms that are close to a misspelled one.
+
+The index uses symmetric deletes, as in SymSpell: every term is stored under
+its (folded, prefix) form and all forms with up to MAX_DISTANCE characters
+deleted, and a query looks up the same keys. Anything within MAX_DISTANCE edits
+shares a key with the query, which is then confirmed with a bounded edit
+distance. The index is a sorted array of (key hash, term position) pairs so
+that it can be memory-mapped from disk.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import List, Sequence
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7
+BUILD_CHUNK_SIZE = 4096  # terms per sorted run while building
+
+
+def fold(term: str) -> str:
+    """Fold a term for comparison."""
+    return term.replace("_", " ").casefold()
+
+
+def edit_distance(first: str, second: str, max_distance: int = MAX_DISTANCE) -> int:
+    """
+    Get the optimal string alignment distance between two strings.
+
+    Gives up early and returns max_distance + 1 once the distance is known to be
+    larger than max_distance.
+    """
+    if first == second:
+        return 0
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+
+    previous_row = None
+    row = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        before_previous_row, previous_row = previous_row, row
+        row = [i] + [0] * len(second)
+        for j, second_char in enumerate(second, 1):
+            cost = 0 if first_char == second_char else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if (
+                before_previous_row is not None
+                and j > 1
+                and first_char == second[j - 2]
+                and first[i - 2] == second_char
+            ):
+                row[j] = min(row[j], before_previous_row[j - 2] + 1)
+        # Transpositions look two rows back, so both rows have to be out of reach.
+        if min(row) > max_distance and min(previous_row) > max_distance:
+            return max_distance + 1
+    return min(row[-1], max_distance + 1)
+
+
+def closest_match(term: str, candidates: Sequence[str]) -> str:
+    """Pick the candidate closest to term, or the first candidate if none of them are close."""
+    folded_term = fold(term)
+    best_match = None
+    best_distance = max(MAX_DISTANCE, len(folded_term) // 3) + 1
+    for candidate in candidates:
+        if candidate == term:
+            return candidate
+        distance = edit_distance(folded_term, fold(candidate), best_distance - 1)
+        if distance < best_distance:
+            best_match, best_distance = candidate, distance
+    return best_match if best_match is not None else candidates[0]
+
+
+def _keys(folded_term: str) -> set:
+    """Get the keys a folded term is stored under."""
+    keys = {folded_term[:PREFIX_LENGTH]}
+    edges = keys
+    for _ in range(MAX_DISTANCE):
+        edges = {key[:i] + key[i + 1 :] for key in edges for i in range(len(key))}
+        keys |= edges
+    return keys
+
+
+def _hash(key: str) -> int:
+    return zlib.crc32(key.encode("utf-8"))
+
+
+class FuzzyIndex:
+    """Deletion index over a sequence of terms that suggests near misses."""
+
+    MAGIC = b"WBFZ"
+    FORMAT_VERSION = 2
+    _HEADER = struct.Struct("<4sIII")
+
+    def __init__(self, terms: Sequence[str], entries: Sequence[int]):
+        self._terms = terms
+        self._entries = entries
+
+    @classmethod
+    def build(cls, terms: Sequence[str]) -> "FuzzyIndex":
+        """
+        Build the index for terms. Positions in terms are what's stored.
+
+        Entries are sorted a chunk of terms at a time and the runs merged, so
+        that no single sort holds the GIL for long and the entries are only
+        ever kept as Python ints a chunk at a time.
+        """
+        runs = []
+        for start in range(0, len(terms), BUILD_CHUNK_SIZE):
+            chunk = range(start, min(start + BUILD_CHUNK_SIZE, len(terms)))
+            runs.append(
+                array(
+                    "Q",
+                    sorted((_hash(key) << 32) | position for position in chunk for key in _keys(fold(terms[position]))),
+                )
+            )
+        entries = array("Q", heapq.merge(*runs))
+        return cls(terms, entries)
+
+    @classmethod
+    def load(cls, path: str, terms: Sequence[str], stamp: str) -> "FuzzyIndex | None":
+        """Map the index at path, or return None if it's missing or wasn't built for these terms."""
+        try:
+            with open(path, "rb") as index_file:
+                buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, version, count, stamp_length = cls._HEADER.unpack_from(buffer)
+            position = cls._HEADER.size
+            file_stamp = buffer[position : position + stamp_length].decode("utf-8")
+            position += -(-stamp_length // 8) * 8  # Stamps are padded to keep the entries aligned.
+            entries = memoryview(buffer)[position:].cast("Q")
+        except (struct.error, UnicodeDecodeError, TypeError, ValueError):
+            buffer.close()
+            return None
+
+        if magic != cls.MAGIC or version != cls.FORMAT_VERSION or count != len(terms) or file_stamp != stamp:
+            entries.release()
+            buffer.close()
+            return None
+        return cls(terms, entries)
+
+    def write(self, path: str, stamp: str):
+        """Save the index to path, tagged with stamp."""
+        encoded_stamp = stamp.encode("utf-8")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as index_file:
+            index_file.write(self._HEADER.pack(self.MAGIC, self.FORMAT_VERSION, len(self._terms), len(encoded_stamp)))
+            index_file.write(encoded_stamp.ljust(-(-len(encoded_stamp) // 8) * 8, b"\0"))
+            index_file.write(array("Q", self._entries).tobytes())
+        os.replace(temp_path, path)
+
+    def suggest(self, term: str, limit: int = 5, max_distance: int = MAX_DISTANCE) -> List[str]:
+        """Get up to limit terms within max_distance edits of term, closest first."""
+        query = fold(term)
+        positions = set()
+        for key in _keys(query):
+            start = _hash(key) << 32
+            first = bisect_left(self._entries, start)
+            last = bisect_left(self._entries, start + (1 << 32), first)
+            positions.update(entry & 0xFFFFFFFF for entry in self._entries[first:last])
+
+        ranked = []
+        for position in positions:
+            candidate = self._terms[position]
+            folded_candidate = fold(candidate)
+            if folded_candidate == query:
+                continue
+            distance = edit_distance(query, folded_candidate, max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, abs(len(folded_candidate) - len(query)), folded_candidate, candidate))
+        ranked.sort()
+        return [candidate for *_, candidate in ranked[:limit]]
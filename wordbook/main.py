@@ -4,6 +4,9 @@
 
 from gettext import gettext as _
 
+# Imported first so that the rest of the imports are timed.
+from wordbook.startup import PROFILE  # isort: skip
+
 import gi
 
 gi.require_version("Gdk", "4.0")
@@ -11,10 +14,11 @@ gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
 from gi.repository import Adw, Gio, GLib, Gtk  # noqa
 
-from wordbook import base, utils  # noqa
-from wordbook.window import WordbookWindow  # noqa
+from wordbook import base, tracing, utils  # noqa
 from wordbook.settings import Settings  # noqa
 
+PROFILE.mark("imports")
+
 
 class Application(Adw.Application):
     """Manages the windows, properties, etc of Wordbook."""
@@ -63,10 +67,42 @@ class Application(Adw.Application):
             "Make it scream louder",
             None,
         )
-
-        Adw.StyleManager.get_default().set_color_scheme(
-            Adw.ColorScheme.FORCE_DARK if Settings.get().gtk_dark_ui else Adw.ColorScheme.PREFER_LIGHT
+        # The headless options are handled by cli before the application is built, and only listed here for --help.
+        self.add_main_option(
+            "batch",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING,
+            "Look up the terms in a file, one per line, or - for stdin, and print JSON Lines",
+            "PATH",
         )
+        self.add_main_option(
+            "import-cdef",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING,
+            "Import custom definitions from a folder or JSON Lines file",
+            "PATH",
+        )
+        self.add_main_option(
+            "export-cdef",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING,
+            "Export custom definitions to a JSON Lines file, or - for stdout",
+            "PATH",
+        )
+        self.add_main_option(
+            "profile-startup",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.NONE,
+            "Print how long each phase of startup took",
+            None,
+        )
+
+        Settings.get()  # Load the config now so that it counts towards its own phase.
+        PROFILE.mark("config")
 
         base.create_required_dirs()
 
@@ -74,16 +110,24 @@ class Application(Adw.Application):
         """Manage startup of the application."""
         self.set_resource_base_path(utils.RES_PATH)
         Adw.Application.do_startup(self)
+        Adw.StyleManager.get_default().set_color_scheme(
+            Adw.ColorScheme.FORCE_DARK if Settings.get().gtk_dark_ui else Adw.ColorScheme.PREFER_LIGHT
+        )
 
     def do_activate(self):
         """Activate the application."""
         self.win = self.get_active_window()
         if not self.win:
+            # The window module is imported here so that its template is only loaded when it's needed.
+            from wordbook.window import WordbookWindow
+
             self.win = WordbookWindow(
                 application=self,
                 title=_("Wordbook"),
                 term=self.lookup_term,
             )
+            PROFILE.mark("window")
+            self.win.connect("realize", self._on_window_realized)
             self.setup_actions()
 
         self.win.present()
@@ -101,6 +145,10 @@ class Application(Adw.Application):
             term = options["look-up"]
 
         utils.log_init(self.development_mode or "verbose" in options or False)
+        if "verbose" in options:
+            tracing.TRACER.enable()
+        if "profile-startup" in options:
+            PROFILE.enable()
 
         if self.win is not None:
             self.win.trigger_search(term)
@@ -110,6 +158,16 @@ class Application(Adw.Application):
         self.activate()
         return 0
 
+    @staticmethod
+    def _on_window_realized(window):
+        """Note the end of startup when the window is first drawn."""
+
+        def on_after_paint(frame_clock):
+            PROFILE.mark("first paint")
+            frame_clock.disconnect(handler_id)
+
+        handler_id = window.get_frame_clock().connect("after-paint", on_after_paint)
+
     def on_about(self, _action, _param):
         """Show the about window."""
         about_window = Adw.AboutWindow()
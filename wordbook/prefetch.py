@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+prefetch looks up the words linked from a definition before they're clicked.
+
+Once a result is shown, the first few of its synonyms, antonyms and related
+words are put in the definition cache by warmup tasks. A new search cancels
+whatever is left. Clicks on links are counted as hits or misses so
+the number of prefetched links can be tuned.
+"""
+
+import threading
+from typing import List
+
+from wordbook import base, utils
+from wordbook.scheduler import TASKS, CancellationToken, Priority
+
+PREFETCH_LIMIT = 20
+LINK_KEYS = ("syn", "ant", "sim", "also_sees")
+
+
+def linked_terms(result: dict, limit: int = PREFETCH_LIMIT) -> List[str]:
+    """Get up to limit search terms linked from a result, in the order they're shown."""
+    terms = {}
+    for synsets in result.values():
+        for synset in sorted(synsets, key=lambda k: k["name"]):
+            for key in LINK_KEYS:
+                for word in synset[key]:
+                    term = base.clean_search_terms(word)
+                    if term:
+                        terms.setdefault(term, None)
+                        if len(terms) >= limit:
+                            return list(terms)
+    return list(terms)
+
+
+class LinkPrefetcher:
+    """Warms the definition cache for the links of the shown result."""
+
+    def __init__(self, limit: int = PREFETCH_LIMIT):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._token: CancellationToken | None = None
+        self._prefetched: set = set()
+
+    def start(self, result: dict, wn_instance):
+        """Start prefetching the links of result, cancelling any earlier prefetch."""
+        self.cancel()
+        terms = linked_terms(result, self.limit)
+        if not terms:
+            return
+        token = self._token = CancellationToken()
+        with self._lock:
+            self._prefetched = set()  # Only links of the shown result can be clicked.
+
+        def prefetch(start: int):
+            """Warm a batch of terms, then queue the next one."""
+            try:
+                warmed = base.warm_definitions(terms[start : start + base.WARMUP_BATCH_SIZE], wn_instance, token)
+            except Exception:
+                utils.log_warning("Prefetching linked words failed.")
+                return
+            with self._lock:
+                if token.cancelled:
+                    return
+                self._prefetched.update(warmed)
+            if start + base.WARMUP_BATCH_SIZE < len(terms):
+                TASKS.submit(Priority.WARMUP, prefetch, start + base.WARMUP_BATCH_SIZE)
+
+        TASKS.submit(Priority.WARMUP, prefetch, 0)
+
+    def cancel(self):
+        """Stop the running prefetch after its current batch."""
+        if self._token is not None:
+            self._token.cancel()
+            self._token = None
+
+    def record_click(self, term: str):
+        """Count a click on a link as a hit if it was prefetched, or a miss if it wasn't."""
+        term = base.clean_search_terms(term)
+        with self._lock:
+            if term in self._prefetched:
+                self.hits += 1
+            else:
+                self.misses += 1
+        utils.log_debug(
+            "Link prefetch hit rate: %.0f%% (%d of %d clicks)", self.hit_rate * 100, self.hits, self.hits + self.misses
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
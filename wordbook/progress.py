@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+progress shows the progress of a WordNet download in the window.
+
+It's kept out of window because it needs wn, which is only imported once a
+download starts.
+"""
+
+from gettext import gettext as _
+
+from gi.repository import Gio, GLib
+from wn.util import ProgressHandler
+
+
+class ProgressUpdater(ProgressHandler):
+    def update(self, n: int = 1, force: bool = False):
+        """Update the progress bar."""
+        self.kwargs["count"] += n
+        if self.kwargs["total"] > 0:
+            progress_fraction = self.kwargs["count"] / self.kwargs["total"]
+            GLib.idle_add(
+                Gio.Application.get_default().win.loading_progress.set_fraction,
+                progress_fraction,
+            )
+
+    @staticmethod
+    def flash(message):
+        """Update the progress label."""
+        if message == "Database":
+            GLib.idle_add(
+                Gio.Application.get_default().win.download_status_page.set_description,
+                _("Building Database…"),
+            )
+        else:
+            GLib.idle_add(
+                Gio.Application.get_default().win.download_status_page.set_description,
+                message,
+            )
+
+    def close(self):
+        """Signal the completion of building the WordNet database."""
+        if self.kwargs["message"] not in ("Download", "Read"):
+            Gio.Application.get_default().win.progress_complete()
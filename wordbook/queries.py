@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+queries fetches everything a lookup needs straight from the wn database.
+
+Walking python-wn objects costs a database round trip for every lemma, sense
+and relation of every synset. The queries here gather the same data for all
+synsets of a term in a handful of set-based queries against the wn.db schema.
+
+Every thread gets its own read-only connection, so lookups on different
+threads don't wait for each other.
+"""
+
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+from unicodedata import combining, normalize
+
+from wordbook import tracing, utils
+
+MMAP_SIZE = 256 * 1024 * 1024  # bytes
+CACHE_SIZE = 16 * 1024  # KiB per connection
+
+_connections = threading.local()
+_generation = 0
+_lexicon_rowids: Dict[tuple, tuple] = {}
+
+
+@dataclass
+class SynsetRecord:
+    """Everything that is presented for one synset."""
+
+    pos: str
+    lemmas: List[str]
+    definition: str | None = None
+    examples: List[str] = field(default_factory=list)
+    antonyms: List[str] = field(default_factory=list)
+    similar: List[str] = field(default_factory=list)
+    also: List[str] = field(default_factory=list)
+
+
+def _normalize_form(form: str) -> str:
+    """Normalize a form the same way python-wn's default normalizer does."""
+    return "".join(c for c in normalize("NFKD", form.lower()) if not combining(c))
+
+
+def _qs(values: Sequence) -> str:
+    return ",".join("?" * len(values))
+
+
+def _chunks(values: Sequence) -> Iterator[Sequence]:
+    """Split values into pieces small enough to bind to a single IN list."""
+    values = list(values)
+    for start in range(0, len(values), utils.SQL_CHUNK_SIZE):
+        yield values[start : start + utils.SQL_CHUNK_SIZE]
+
+
+def _check(token):
+    """Raise LookupCancelled if token has been cancelled."""
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Get this thread's read-only connection to the wn database.
+
+    The database isn't written to while it's in use, so it's opened as
+    immutable and SQLite skips locking and change detection.
+    """
+    import wn  # Only imported once a lookup needs the database, by which time base has set it up.
+
+    connection = getattr(_connections, "connection", None)
+    if connection is not None and _connections.generation == _generation:
+        return connection
+    if connection is not None:
+        connection.close()
+    connection = sqlite3.connect(f"{Path(wn.config.database_path).as_uri()}?mode=ro&immutable=1", uri=True)
+    connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE}")
+    connection.execute("PRAGMA query_only = ON")
+    _connections.connection = connection
+    _connections.generation = _generation
+    return connection
+
+
+def reset_connections():
+    """Make every thread reopen its connection, for when the wn database has been replaced or removed."""
+    global _generation
+    _generation += 1
+    _lexicon_rowids.clear()
+
+
+def _get_lexicon_rowids(connection: sqlite3.Connection, specifiers: Sequence[str]) -> tuple:
+    """Resolve lexicon specifiers like 'oewn:2022' to database rowids."""
+    key = tuple(specifiers)
+    if key not in _lexicon_rowids:
+        rowids = []
+        for specifier in specifiers:
+            lexicon_id, _, version = specifier.partition(":")
+            row = connection.execute(
+                "SELECT rowid FROM lexicons WHERE id = ? AND version = ?",
+                (lexicon_id, version),
+            ).fetchone()
+            if row is not None:
+                rowids.append(row[0])
+        _lexicon_rowids[key] = tuple(rowids)
+    return _lexicon_rowids[key]
+
+
+def _find_synsets(connection, forms: Sequence[str], lexids: tuple) -> List[tuple]:
+    """Find (rowid, pos) of synsets with a member matching one of forms, like Wordnet.synsets() does."""
+    rows = connection.execute(
+        f"""
+          WITH wordforms(s) AS (VALUES {",".join(["(?)"] * len(forms))})
+        SELECT DISTINCT ss.rowid, ss.pos
+          FROM synsets AS ss
+          JOIN (SELECT _s.entry_rowid, _s.synset_rowid, _s.entry_rank
+                  FROM forms AS f
+                  JOIN senses AS _s ON _s.entry_rowid = f.entry_rowid
+                 WHERE (f.form IN wordforms OR normalized_form IN wordforms)) AS s
+            ON s.synset_rowid = ss.rowid
+         WHERE ss.lexicon_rowid IN ({_qs(lexids)})
+         ORDER BY s.entry_rowid, s.entry_rank
+        """,
+        (*forms, *lexids),
+    ).fetchall()
+    unique_rows = []
+    seen = set()
+    for row in rows:
+        if row not in seen:
+            unique_rows.append(row)
+            seen.add(row)
+    return unique_rows
+
+
+def _get_members(connection, synset_rowids: Sequence[int], lexids: tuple) -> Dict[int, List[tuple]]:
+    """Get the (sense rowid, lemma) members of each synset, in synset order."""
+    members: Dict[int, List[tuple]] = {rowid: [] for rowid in synset_rowids}
+    for chunk in _chunks(synset_rowids):
+        rows = connection.execute(
+            f"""
+            SELECT s.synset_rowid, s.rowid,
+                   (SELECT f.form FROM forms AS f WHERE f.entry_rowid = s.entry_rowid ORDER BY f.rank LIMIT 1)
+              FROM senses AS s
+             WHERE s.synset_rowid IN ({_qs(chunk)})
+               AND s.lexicon_rowid IN ({_qs(lexids)})
+             ORDER BY s.synset_rowid, s.synset_rank
+            """,
+            (*chunk, *lexids),
+        )
+        for synset_rowid, sense_rowid, lemma in rows:
+            members[synset_rowid].append((sense_rowid, lemma))
+    return members
+
+
+def _find_synsets_many(connection, terms: Sequence[str], lexids: tuple) -> Dict[str, List[tuple]]:
+    """Find (rowid, pos) of the synsets of several terms at once, in the order _find_synsets gives them."""
+    synsets: Dict[str, List[tuple]] = {term: [] for term in terms}
+    seen = set()
+    for chunk in _chunks(terms):
+        rows = connection.execute(
+            f"""
+              WITH wordforms(s) AS (VALUES {",".join(["(?)"] * len(chunk))})
+            SELECT w.s, ss.rowid, ss.pos
+              FROM wordforms AS w
+              JOIN forms AS f ON f.form = w.s OR f.normalized_form = w.s
+              JOIN senses AS s ON s.entry_rowid = f.entry_rowid
+              JOIN synsets AS ss ON s.synset_rowid = ss.rowid
+             WHERE ss.lexicon_rowid IN ({_qs(lexids)})
+             ORDER BY s.entry_rowid, s.entry_rank
+            """,
+            (*chunk, *lexids),
+        )
+        for term, rowid, pos in rows:
+            if (term, rowid, pos) not in seen:
+                synsets[term].append((rowid, pos))
+                seen.add((term, rowid, pos))
+    return synsets
+
+
+def _build_records(connection, synsets: Sequence[tuple], lexids: tuple, token=None) -> Dict[int, SynsetRecord]:
+    """Gather the records of the given (rowid, pos) synsets."""
+    synset_rowids = [rowid for rowid, _pos in synsets]
+    records = {rowid: SynsetRecord(pos=pos, lemmas=[]) for rowid, pos in synsets}
+
+    # Every query is run on chunks of synsets, each of which keeps its own rows in order.
+    related = []
+    for chunk in _chunks(synset_rowids):
+        _check(token)
+        for synset_rowid, definition in connection.execute(
+            f"""
+            SELECT synset_rowid, definition
+              FROM definitions
+             WHERE synset_rowid IN ({_qs(chunk)})
+               AND lexicon_rowid IN ({_qs(lexids)})
+             ORDER BY rowid
+            """,
+            (*chunk, *lexids),
+        ):
+            if records[synset_rowid].definition is None:
+                records[synset_rowid].definition = definition
+
+        for synset_rowid, example in connection.execute(
+            f"""
+            SELECT synset_rowid, example
+              FROM synset_examples
+             WHERE synset_rowid IN ({_qs(chunk)})
+               AND lexicon_rowid IN ({_qs(lexids)})
+             ORDER BY rowid
+            """,
+            (*chunk, *lexids),
+        ):
+            records[synset_rowid].examples.append(example)
+
+        related += connection.execute(
+            f"""
+            SELECT srel.source_rowid, rt.type, srel.target_rowid
+              FROM synset_relations AS srel
+              JOIN relation_types AS rt ON srel.type_rowid = rt.rowid
+              JOIN synsets AS tgt ON tgt.rowid = srel.target_rowid
+             WHERE srel.source_rowid IN ({_qs(chunk)})
+               AND rt.type IN ('similar', 'also')
+               AND srel.lexicon_rowid IN ({_qs(lexids)})
+               AND tgt.lexicon_rowid IN ({_qs(lexids)})
+             ORDER BY srel.source_rowid, srel.rowid
+            """,
+            (*chunk, *lexids, *lexids),
+        ).fetchall()
+
+    # One query for the members of the synsets and the synsets they point to.
+    _check(token)
+    member_rowids = list(dict.fromkeys([*synset_rowids, *(target for _, _, target in related)]))
+    members = _get_members(connection, member_rowids, lexids)
+
+    for synset_rowid, relation, target_rowid in related:
+        lemmas = [lemma for _, lemma in members[target_rowid]]
+        if relation == "similar":
+            records[synset_rowid].similar.extend(lemmas)
+        else:
+            records[synset_rowid].also.extend(lemmas)
+
+    sense_synsets = {}
+    for synset_rowid in synset_rowids:
+        records[synset_rowid].lemmas = [lemma for _, lemma in members[synset_rowid]]
+        for sense_rowid, _lemma in members[synset_rowid]:
+            sense_synsets[sense_rowid] = synset_rowid
+
+    if sense_synsets:
+        antonyms: Dict[int, List[str]] = {}
+        for chunk in _chunks(sense_synsets):
+            _check(token)
+            for sense_rowid, lemma in connection.execute(
+                f"""
+                SELECT srel.source_rowid,
+                       (SELECT f.form FROM forms AS f WHERE f.entry_rowid = tgt.entry_rowid ORDER BY f.rank LIMIT 1)
+                  FROM sense_relations AS srel
+                  JOIN relation_types AS rt ON srel.type_rowid = rt.rowid
+                  JOIN senses AS tgt ON tgt.rowid = srel.target_rowid
+                 WHERE srel.source_rowid IN ({_qs(chunk)})
+                   AND rt.type = 'antonym'
+                   AND srel.lexicon_rowid IN ({_qs(lexids)})
+                   AND tgt.lexicon_rowid IN ({_qs(lexids)})
+                 ORDER BY srel.rowid
+                """,
+                (*chunk, *lexids, *lexids),
+            ):
+                antonyms.setdefault(sense_rowid, []).append(lemma)
+        for synset_rowid in synset_rowids:
+            for sense_rowid, _lemma in members[synset_rowid]:
+                records[synset_rowid].antonyms.extend(antonyms.get(sense_rowid, []))
+
+    return records
+
+
+def find_synset_records(term: str, lexicon_specifiers: Sequence[str], token=None) -> List[SynsetRecord]:
+    """
+    Get the records for every synset of term in the given lexicons, in python-wn's order.
+
+    If a cancellation token is given, LookupCancelled is raised between
+    queries once it's cancelled.
+    """
+    connection = _connect()
+    lexids = _get_lexicon_rowids(connection, lexicon_specifiers)
+    if not lexids:
+        return []
+
+    with tracing.span("synsets", term=term):
+        synsets = _find_synsets(connection, [term], lexids)
+        if not synsets:
+            _check(token)
+            synsets = _find_synsets(connection, [_normalize_form(term)], lexids)
+    if not synsets:
+        return []
+    _check(token)
+    with tracing.span("relations", synsets=len(synsets)):
+        records = _build_records(connection, synsets, lexids, token)
+    return [records[rowid] for rowid, _pos in synsets]
+
+
+def find_synset_records_many(terms: Sequence[str], lexicon_specifiers: Sequence[str]) -> Dict[str, List[SynsetRecord]]:
+    """Get the records of several terms with one set of queries, like find_synset_records for each."""
+    connection = _connect()
+    lexids = _get_lexicon_rowids(connection, lexicon_specifiers)
+    if not lexids or not terms:
+        return {term: [] for term in terms}
+
+    with tracing.span("synsets", terms=len(terms)):
+        synsets = _find_synsets_many(connection, terms, lexids)
+        # Terms without matches get a second chance in their normalized form, like in find_synset_records.
+        normalized = {term: _normalize_form(term) for term in terms if not synsets[term]}
+        if normalized:
+            normalized_synsets = _find_synsets_many(connection, list(dict.fromkeys(normalized.values())), lexids)
+            for term, form in normalized.items():
+                synsets[term] = normalized_synsets[form]
+
+    all_synsets = list(dict.fromkeys(synset for term_synsets in synsets.values() for synset in term_synsets))
+    with tracing.span("relations", synsets=len(all_synsets)):
+        records = _build_records(connection, all_synsets, lexids) if all_synsets else {}
+    return {term: [records[rowid] for rowid, _pos in synsets[term]] for term in terms}
+
+
+def iter_lemmas(lexicon_specifiers: Sequence[str], chunk_size: int) -> Iterator[List[str]]:
+    """Read the lemma of every word in the given lexicons, chunk_size at a time, as the database gives them."""
+    connection = _connect()
+    lexids = _get_lexicon_rowids(connection, lexicon_specifiers)
+    if not lexids:
+        return
+    cursor = connection.execute(
+        f"SELECT form FROM forms WHERE rank = 0 AND lexicon_rowid IN ({_qs(lexids)})",
+        lexids,
+    )
+    while chunk := cursor.fetchmany(chunk_size):
+        yield [row[0] for row in chunk]
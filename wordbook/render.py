@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+render turns lookup results into Pango markup.
+
+It doesn't depend on GTK. Markup is built from lists joined once at the end,
+and the last few rendered results are kept so that going back to a term
+doesn't render it again.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List
+
+CACHE_SIZE = 32
+
+
+def word_links(words: List[str], word_col: str) -> str:
+    """Process word links like synonyms, antonyms, etc."""
+    return ", ".join(f'<span foreground="{word_col}"><a href="search;{word}">{word}</a></span>' for word in words)
+
+
+def render_sections(result: dict, word_col: str, sen_col: str) -> List[str]:
+    """Process results from wn into one piece of markup for each part of speech."""
+    sections = []
+    for pos, synsets in result.items():
+        parts = []
+        orig_synset = None
+        i = 0
+        for synset in sorted(synsets, key=lambda k: k["name"]):
+            synset_name = synset["name"]
+            if synset_name != orig_synset:
+                i = 1
+                if parts:
+                    parts.append("\n\n")
+                parts.append(f"{synset_name} ~ <b>{pos}</b>")
+                orig_synset = synset_name
+            else:
+                i += 1
+            parts.append(f'\n  <b>{i}</b>: {synset["definition"]}')
+
+            for example in synset["examples"]:
+                parts.append(f'\n        <span foreground="{sen_col}">{example}</span>')
+
+            for label, key in (
+                ("Synonyms", "syn"),
+                ("Antonyms", "ant"),
+                ("Similar to", "sim"),
+                ("Also see", "also_sees"),
+            ):
+                if synset[key]:
+                    parts.append(f"\n        {label}:<i> {word_links(synset[key], word_col)}</i>")
+        if parts:
+            sections.append("".join(parts))
+    return sections
+
+
+def render_result(result: dict, word_col: str, sen_col: str) -> str:
+    """Process results from wn into a single piece of markup."""
+    return "\n\n".join(render_sections(result, word_col, sen_col))
+
+
+class RenderCache:
+    """Rendered sections of the last few results, by (term, lexicon, palette)."""
+
+    def __init__(self, max_items: int = CACHE_SIZE):
+        self.max_items = max_items
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, term: str, lexicon: str, result: dict, word_col: str, sen_col: str) -> tuple:
+        """Render the sections of result, or reuse them from the last time it was rendered with these colors."""
+        key = (term, lexicon, (word_col, sen_col))
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        sections = tuple(render_sections(result, word_col, sen_col))
+        with self._lock:
+            self._items[key] = sections
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return sections
+
+    def clear(self):
+        """Forget everything that has been rendered."""
+        with self._lock:
+            self._items.clear()
+
+
+RENDER_CACHE = RenderCache()
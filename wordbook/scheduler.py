@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+scheduler runs Wordbook's background work.
+
+All of it goes through TASKS, a small set of threads that always picks the
+most urgent class of task first and keeps a few threads free for searches.
+Searches are run so that only the latest one counts: every search gets a
+CancellationToken that lookups check between steps, a new search cancels the
+previous one, and results only reach the UI if no newer search has been
+submitted since.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Any, Callable
+
+from gi.repository import GLib
+
+from wordbook import tracing, utils
+
+DEBOUNCE_DELAY = 150  # milliseconds
+WORKERS = 6
+INTERACTIVE_RESERVE = 3  # A search waits on its entry and pronunciation, so it can take three threads.
+
+
+class Priority(IntEnum):
+    """Classes of background work, most urgent first."""
+
+    INTERACTIVE = 0  # Searches and what they wait on.
+    COMPLETION = 1  # Completions and suggestions for what's being typed.
+    WARMUP = 2  # Filling caches ahead of time.
+    MAINTENANCE = 3  # Downloads and other housekeeping.
+
+
+QUEUE_LIMITS = {
+    Priority.INTERACTIVE: 32,
+    Priority.COMPLETION: 4,
+    Priority.WARMUP: 8,
+    Priority.MAINTENANCE: 4,
+}
+
+
+class LookupCancelled(Exception):
+    """Raised inside a lookup once a newer search has replaced it."""
+
+
+class CancellationToken:
+    """Tells a lookup running in another thread that its result isn't wanted anymore."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Mark the lookup as cancelled."""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """Raise LookupCancelled if the lookup has been cancelled."""
+        if self._event.is_set():
+            raise LookupCancelled()
+
+
+class TaskScheduler:
+    """
+    Runs tasks on a bounded set of threads, most urgent class first.
+
+    Tasks other than interactive ones never take the last few threads, so
+    background work can't keep a search waiting. When too many tasks of a
+    class are waiting, the oldest one is dropped. Threads are only started
+    once there's work for them.
+    """
+
+    def __init__(self, workers: int = WORKERS, reserve: int = INTERACTIVE_RESERVE, queue_limits=QUEUE_LIMITS):
+        self.workers = workers
+        self.reserve = max(0, min(reserve, workers - 1))
+        self.queue_limits = dict(queue_limits)
+        self._queues = {priority: deque() for priority in Priority}
+        self._condition = threading.Condition()
+        self._threads = 0
+        self._idle = 0
+        self._background = 0
+
+    def submit(self, priority: Priority, func: Callable, *args, **kwargs) -> Future:
+        """Queue func(*args, **kwargs) as a task of a class. Cancelling its future drops it if it hasn't started."""
+        future: Future = Future()
+        with self._condition:
+            queue = self._queues[priority]
+            while queue and len(queue) >= self.queue_limits[priority]:
+                queue.popleft()[0].cancel()
+            queue.append((future, func, args, kwargs))
+            if self._idle == 0 and self._threads < self.workers:
+                self._threads += 1
+                threading.Thread(target=self._work, name=f"wordbook-task-{self._threads}", daemon=True).start()
+            self._condition.notify()
+        return future
+
+    def pending(self, priority: Priority) -> int:
+        """Get how many tasks of a class are waiting."""
+        with self._condition:
+            return len(self._queues[priority])
+
+    def _next_task(self):
+        """Take the most urgent task that may run now, or None. Must be called with the condition held."""
+        for priority, queue in self._queues.items():
+            if priority != Priority.INTERACTIVE and self._background >= self.workers - self.reserve:
+                break
+            while queue:
+                future, func, args, kwargs = queue.popleft()
+                if future.set_running_or_notify_cancel():
+                    if priority != Priority.INTERACTIVE:
+                        self._background += 1
+                    return priority, future, func, args, kwargs
+        return None
+
+    def _work(self):
+        """Run tasks as they come in."""
+        while True:
+            with self._condition:
+                task = self._next_task()
+                while task is None:
+                    self._idle += 1
+                    self._condition.wait()
+                    self._idle -= 1
+                    task = self._next_task()
+            priority, future, func, args, kwargs = task
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as ex:
+                future.set_exception(ex)
+            finally:
+                if priority != Priority.INTERACTIVE:
+                    with self._condition:
+                        self._background -= 1
+                        self._condition.notify()
+            del task, future, func, args, kwargs
+
+
+TASKS = TaskScheduler()
+
+
+class SearchScheduler:
+    """
+    Runs searches as interactive tasks, latest wins.
+
+    search(request, token) runs in the background and deliver(request, result)
+    on the main loop. Both submit() and cancel() must be called from the main
+    loop as well. pending is the request that's waiting or running, if any.
+    """
+
+    def __init__(
+        self,
+        search: Callable[[Any, CancellationToken], Any],
+        deliver: Callable[[Any, Any], None],
+        delay: int = DEBOUNCE_DELAY,
+        tasks: TaskScheduler = TASKS,
+    ):
+        self._search = search
+        self._deliver = deliver
+        self.delay = delay
+        self._tasks = tasks
+        self._future: Future | None = None
+        self._generation = 0
+        self._token: CancellationToken | None = None
+        self._timeout_id = 0
+        self.pending = None
+
+    def submit(self, request, debounce: bool = False):
+        """Schedule a search, replacing any that's waiting or running. Debounced searches wait for a pause first."""
+        self.cancel()
+        self.pending = request
+        token = self._token = CancellationToken()
+        if debounce and self.delay > 0:
+            self._timeout_id = GLib.timeout_add(self.delay, self._start, self._generation, request, token)
+        else:
+            self._start(self._generation, request, token)
+
+    def cancel(self):
+        """Drop the search that's waiting or running, if any."""
+        self._generation += 1
+        self.pending = None
+        if self._token is not None:
+            self._token.cancel()
+            self._token = None
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+        if self._timeout_id:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = 0
+
+    def post(self, token: CancellationToken, callback: Callable, *args):
+        """Run callback on the main loop, unless the search token belongs to has been replaced by then."""
+
+        queued = time.perf_counter_ns()
+
+        def run():
+            tracing.TRACER.record("idle_add wait", queued, time.perf_counter_ns())
+            if not token.cancelled:
+                callback(*args)
+            return GLib.SOURCE_REMOVE
+
+        GLib.idle_add(run)
+
+    def _start(self, generation: int, request, token: CancellationToken):
+        self._timeout_id = 0
+        self._future = self._tasks.submit(Priority.INTERACTIVE, self._run, generation, request, token)
+        return GLib.SOURCE_REMOVE
+
+    def _run(self, generation: int, request, token: CancellationToken):
+        """Run a search in the background and hand its result to the main loop."""
+        if token.cancelled:
+            return
+        try:
+            result = self._search(request, token)
+        except LookupCancelled:
+            return
+        except Exception:
+            utils.log_error(f"Search for {request!r} failed.")
+            GLib.idle_add(self._forget, generation)
+            return
+        GLib.idle_add(self._finish, generation, request, result, time.perf_counter_ns())
+
+    def _forget(self, generation: int):
+        """Stop counting a failed search as pending, unless a newer search has been submitted."""
+        if generation == self._generation:
+            self.pending = None
+        return GLib.SOURCE_REMOVE
+
+    def _finish(self, generation: int, request, result, queued: int):
+        """Deliver a result, unless a newer search has been submitted in the meantime."""
+        tracing.TRACER.record("idle_add wait", queued, time.perf_counter_ns())
+        if generation == self._generation:
+            self.pending = None
+            with tracing.span("deliver"):
+                self._deliver(request, result)
+        return GLib.SOURCE_REMOVE
@@ -59,12 +59,14 @@ class Settings:
                 "LiveSearch": "yes",
                 "DoubleClick": "no",
                 "PronunciationsAccent": "us",
+                "PronunciationsWarmup": "history",
             }
             self.config["Appearance"] = {
                 "ForceDarkMode": "no",
             }
             self.config["Misc"] = {
                 "ConfigVersion": "6",
+                "DefinitionCacheSize": "32",
                 "History": "[]",
             }
         else:
@@ -90,6 +92,17 @@ class Settings:
         """Set whether to search on double click."""
         self.set_boolean_key("Behavior", "DoubleClick", value)
 
+    @property
+    def definition_cache_size(self):
+        """Get the size limit of the on-disk definition cache in MiB."""
+        return self.config.getint("Misc", "DefinitionCacheSize", fallback=32)
+
+    @definition_cache_size.setter
+    def definition_cache_size(self, value):
+        """Set the size limit of the on-disk definition cache in MiB."""
+        self.config.set("Misc", "DefinitionCacheSize", str(value))
+        self.save_settings()  # Manually save because set_boolean_key is not called.
+
     @staticmethod
     def get():
         """Return an instance of Settings"""
@@ -224,6 +237,17 @@ class Settings:
         elif value == 1:
             self.pronunciations_accent = "gb"
 
+    @property
+    def pronunciations_warmup(self):
+        """Get which terms to precompute pronunciations for: 'none', 'history' or 'all'."""
+        return self.config.get("Behavior", "PronunciationsWarmup", fallback="history")
+
+    @pronunciations_warmup.setter
+    def pronunciations_warmup(self, value):
+        """Set which terms to precompute pronunciations for."""
+        self.config.set("Behavior", "PronunciationsWarmup", value)
+        self.save_settings()  # Manually save because set_boolean_key is not called.
+
     def save_settings(self):
         """Save settings."""
         with open(utils.CONFIG_FILE, "w") as file:
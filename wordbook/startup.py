@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+startup times the phases of a launch for --profile-startup.
+
+Phases are marked as they're reached, in whatever order and thread that
+happens in, and the breakdown is printed once all of them have been. Times
+are counted from when Wordbook's own modules started loading.
+"""
+
+import sys
+import threading
+import time
+
+PHASES = ("imports", "config", "window", "wordnet", "wordlist", "first paint")
+
+
+class StartupProfile:
+    """When each phase of startup was reached."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.enabled = False
+        self._marks = {}
+        self._reported = False
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """Print the breakdown once every phase has been reached."""
+        self.enabled = True
+        self._report_if_done()
+
+    def mark(self, phase: str):
+        """Note that a phase has been reached. Only the first time counts."""
+        with self._lock:
+            self._marks.setdefault(phase, time.perf_counter())
+        self._report_if_done()
+
+    def _report_if_done(self):
+        with self._lock:
+            if not self.enabled or self._reported or not all(phase in self._marks for phase in PHASES):
+                return
+            self._reported = True
+            marks = sorted(self._marks.items(), key=lambda item: item[1])
+        print(self.format(marks), file=sys.stderr)
+
+    def format(self, marks) -> str:
+        """Format (phase, time) pairs as a table of times since start and since the previous phase."""
+        lines = ["Startup profile (ms):"]
+        previous = self.start
+        for phase, mark in marks:
+            lines.append(f"  {phase:<12} {(mark - self.start) * 1000:8.1f}  (+{(mark - previous) * 1000:.1f})")
+            previous = mark
+        return "\n".join(lines)
+
+
+PROFILE = StartupProfile()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+tracing records how long each stage of a lookup takes.
+
+Spans are kept in a ring buffer and written out in Chrome's trace event format
+on exit, for chrome://tracing or Perfetto. Tracing is switched on by --verbose
+or by setting WORDBOOK_TRACE, to 1 or to the file the trace should go to.
+When it's off, span() hands back a shared no-op context manager.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from wordbook import utils
+
+ENV_VAR = "WORDBOOK_TRACE"
+TRACE_FILE = os.path.join(utils.DATA_DIR, "trace.json")
+BUFFER_SIZE = 8192  # spans
+
+
+class _NullSpan:
+    """What span() gives while tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+
+class _Span:
+    """Times the block it's used on and records it when the block ends."""
+
+    __slots__ = ("_tracer", "_name", "_args", "_start")
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_exc):
+        self._tracer.record(self._name, self._start, time.perf_counter_ns(), **self._args)
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Ring buffer of the most recent spans."""
+
+    def __init__(self, size: int = BUFFER_SIZE):
+        self.enabled = False
+        self.path = TRACE_FILE
+        self._events: deque = deque(maxlen=size)
+        self._thread_names: dict = {}
+        self._dump_registered = False
+
+    def enable(self, path: str | None = None):
+        """Start recording spans, to be written to path (or TRACE_FILE) on exit."""
+        self.enabled = True
+        if path:
+            self.path = path
+        if not self._dump_registered:
+            self._dump_registered = True
+            atexit.register(self._dump_on_exit)
+
+    def span(self, name: str, **args):
+        """Get a context manager that records a span for the block it wraps, if tracing is on."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name: str, start: int, end: int, **args):
+        """Record a span between two time.perf_counter_ns() readings, if tracing is on."""
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        self._thread_names[thread.ident] = thread.name
+        self._events.append((name, start, end, thread.ident, args))
+
+    def events(self) -> list:
+        """Get the recorded spans in Chrome's trace event format, oldest first."""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in list(self._thread_names.items())
+        ]
+        for name, start, end, tid, args in list(self._events):
+            event = {"name": name, "cat": "wordbook", "ph": "X", "pid": pid, "tid": tid}
+            event["ts"] = start / 1000
+            event["dur"] = (end - start) / 1000
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            events.append(event)
+        return events
+
+    def dump(self, path: str):
+        """Write the recorded spans to path as a Chrome trace."""
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, trace_file)
+
+    def _dump_on_exit(self):
+        if not self._events:
+            return
+        try:
+            self.dump(self.path)
+        except OSError:
+            utils.log_warning(f"Couldn't write the trace to {self.path}.")
+            return
+        utils.log_info(f"Wrote the trace to {self.path}.")
+
+
+TRACER = Tracer()
+span = TRACER.span
+
+if os.environ.get(ENV_VAR):
+    TRACER.enable(None if os.environ[ENV_VAR] == "1" else os.environ[ENV_VAR])
@@ -3,9 +3,13 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 """utils contains a few global variables and essential functions."""
+
+import atexit
+import json
 import logging
 import os
-import traceback
+import sys
+from collections import deque
 
 from gi.repository import GLib
 
@@ -16,9 +20,42 @@ CONFIG_FILE = os.path.join(CONFIG_DIR, "wordbook.conf")
 DATA_DIR = os.path.join(GLib.get_user_data_dir(), "wordbook")
 CDEF_DIR = os.path.join(DATA_DIR, "cdef")
 WN_DIR = os.path.join(DATA_DIR, "wn")
+LOG_FILE = os.path.join(DATA_DIR, "log.jsonl")
 
 logging.basicConfig(format="%(asctime)s - [%(levelname)s] [%(threadName)s] (%(module)s:%(lineno)d) %(message)s")
 LOGGER = logging.getLogger()
+LOG_BUFFER_SIZE = 1000  # records
+SQL_CHUNK_SIZE = 500  # values bound per IN list, well under SQLite's default limit of 999 variables
+
+
+class LogBuffer(logging.Handler):
+    """Keeps the most recent log records in memory, to be read back as JSON Lines."""
+
+    def __init__(self, capacity: int = LOG_BUFFER_SIZE):
+        super().__init__()
+        self.records: deque = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "thread": record.threadName,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            entry["traceback"] = record.exc_text
+        self.records.append(entry)
+
+    def dump(self) -> str:
+        """Get the buffered records as JSON Lines, oldest first."""
+        return "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in list(self.records))
+
+
+LOG_BUFFER: LogBuffer | None = None
 
 
 def bool_to_str(boolean):
@@ -29,49 +66,62 @@ def bool_to_str(boolean):
 
 
 def log_init(debug):
-    """Initialize logging."""
+    """Initialize logging. Debug logging also keeps recent records in LOG_BUFFER, written to LOG_FILE on exit."""
+    global LOG_BUFFER
     if debug is True:
         level = logging.DEBUG
+        if LOG_BUFFER is None:
+            LOG_BUFFER = LogBuffer()
+            LOGGER.addHandler(LOG_BUFFER)
+            atexit.register(_dump_log_buffer)
     else:
         level = logging.WARNING
     LOGGER.setLevel(level)
 
 
-def log_critical(message):
+def _dump_log_buffer():
+    if not LOG_BUFFER.records:
+        return
+    try:
+        with open(LOG_FILE, "w", encoding="utf-8") as log_file:
+            log_file.write(LOG_BUFFER.dump())
+    except OSError:
+        log_warning(f"Couldn't write the log to {LOG_FILE}.")
+
+
+def _log(level, message, args):
+    """
+    Log a message at level, with the traceback of the exception being handled if there is one.
+
+    Nothing is formatted unless the level is enabled. Extra args are
+    %-formatted into message only when the record is written.
+    """
+    if not LOGGER.isEnabledFor(level):
+        return
+    # stacklevel=3 credits the caller of the log_* function instead of this one.
+    LOGGER.log(level, message, *args, exc_info=sys.exc_info()[0] is not None, stacklevel=3)
+
+
+def log_critical(message, *args):
     """Log a critical error and if possible, its traceback."""
-    LOGGER.critical(message)
-    trace = traceback.format_exc()
-    if trace.strip() != "NoneType: None":
-        LOGGER.critical(traceback.format_exc())
+    _log(logging.CRITICAL, message, args)
 
 
-def log_debug(message):
+def log_debug(message, *args):
     """Log a debug message and if possible, its traceback."""
-    LOGGER.debug(message)
-    trace = traceback.format_exc()
-    if trace.strip() != "NoneType: None":
-        LOGGER.debug(traceback.format_exc())
+    _log(logging.DEBUG, message, args)
 
 
-def log_error(message):
+def log_error(message, *args):
     """Log an error and if possible, its traceback."""
-    LOGGER.error(message)
-    trace = traceback.format_exc()
-    if trace.strip() != "NoneType: None":
-        LOGGER.error(traceback.format_exc())
+    _log(logging.ERROR, message, args)
 
 
-def log_info(message):
+def log_info(message, *args):
     """Log a message and if possible, its traceback."""
-    LOGGER.info(message)
-    trace = traceback.format_exc()
-    if trace.strip() != "NoneType: None":
-        LOGGER.info(trace)
+    _log(logging.INFO, message, args)
 
 
-def log_warning(message):
+def log_warning(message, *args):
     """Log a warning and if possible, its traceback."""
-    LOGGER.warning(message)
-    trace = traceback.format_exc()
-    if trace.strip() != "NoneType: None":
-        LOGGER.warning(traceback.format_exc())
+    _log(logging.WARNING, message, args)
@@ -2,21 +2,25 @@
 # SPDX-FileCopyrightText: 2016-2024 Mufeed Ali <mufeed@kumo.foo>
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import os
 import random
 import sys
 import threading
 from enum import Enum
 from gettext import gettext as _
 from html import escape
+from typing import Sequence
 
 from gi.repository import Adw, Gdk, Gio, GLib, GObject, Gtk
-from wn import Error
-from wn.util import ProgressHandler
 
-from wordbook import base, utils
+from wordbook import base, tracing, utils
+from wordbook.prefetch import LinkPrefetcher
+from wordbook.render import RENDER_CACHE
+from wordbook.scheduler import TASKS, Priority, SearchScheduler
 from wordbook.settings import Settings
 from wordbook.settings_window import SettingsDialog
+from wordbook.startup import PROFILE
+
+EXCEPT_LIST = ("fortune -a", "cowfortune")  # Searches that give a new result every time.
 
 
 @Gtk.Template(resource_path=f"{utils.RES_PATH}/ui/window.ui")
@@ -37,10 +41,11 @@ class WordbookWindow(Adw.ApplicationWindow):
     _history_listbox: Gtk.ListBox = Gtk.Template.Child("history_listbox")  # type: ignore
     _main_stack: Adw.ViewStack = Gtk.Template.Child("main_stack")  # type: ignore
     _main_scroll: Gtk.ScrolledWindow = Gtk.Template.Child("main_scroll")  # type: ignore
-    _def_view: Gtk.Label = Gtk.Template.Child("def_view")  # type: ignore
-    _def_ctrlr: Gtk.GestureClick = Gtk.Template.Child("def_ctrlr")  # type: ignore
+    _def_scroll: Gtk.ScrolledWindow = Gtk.Template.Child("def_scroll")  # type: ignore
+    _def_list_view: Gtk.ListView = Gtk.Template.Child("def_list_view")  # type: ignore
     _pronunciation_view: Gtk.Label = Gtk.Template.Child("pronunciation_view")  # type: ignore
     _term_view: Gtk.Label = Gtk.Template.Child("term_view")  # type: ignore
+    _did_you_mean_label: Gtk.Label = Gtk.Template.Child("did_you_mean_label")  # type: ignore
     _network_fail_status_page: Adw.StatusPage = Gtk.Template.Child("network_fail_status_page")  # type: ignore
     _retry_button: Gtk.Button = Gtk.Template.Child("retry_button")  # type: ignore
     _exit_button: Gtk.Button = Gtk.Template.Child("exit_button")  # type: ignore
@@ -49,22 +54,34 @@ class WordbookWindow(Adw.ApplicationWindow):
 
     _wn_downloader: base.WordnetDownloader = base.WordnetDownloader()
     _wn_future = None
+    _index_future = None
+    _completion_index: base.PartialCompletionIndex = base.PartialCompletionIndex()
+    _fuzzy_future = None
 
     _doubled: bool = False
     _completion_request_count: int = 0
     _searched_term: str | None = None
     _search_history = None
+    _definition_sections = None
+    _def_extra_menu = None
     _search_history_list = []
-    _search_queue = []
+    _search_scheduler: SearchScheduler | None = None
+    _prefetcher: LinkPrefetcher | None = None
     _last_search_fail = False
-    _active_thread = None
+    _shown_result: dict | None = None
+    _shown_request: tuple | None = None
+    _early_pronunciation: tuple | None = None
     _primary_clipboard_text = None
+    _warmup_stop: threading.Event | None = None
 
     def __init__(self, term="", **kwargs):
         """Initialize the window."""
         super().__init__(**kwargs)
 
         self.lookup_term = term
+        # Per window, so that closing one doesn't stop another's background work.
+        self._prefetcher = LinkPrefetcher()
+        self._warmup_stop = threading.Event()
 
         if Gio.Application.get_default().development_mode is True:
             self.get_style_context().add_class("devel")
@@ -76,15 +93,22 @@ class WordbookWindow(Adw.ApplicationWindow):
     def setup_widgets(self):
         """Setup the widgets in the window."""
         self._search_history = Gio.ListStore.new(HistoryObject)
+        self._search_scheduler = SearchScheduler(self.threaded_search, self._show_search_result)
         self._history_listbox.bind_model(self._search_history, self._create_label)
 
+        # Definitions are shown a part of speech per row, so only what's on screen is laid out.
+        self._definition_sections = Gio.ListStore.new(DefinitionSection)
+        section_factory = Gtk.SignalListItemFactory()
+        section_factory.connect("setup", self._on_section_setup)
+        section_factory.connect("bind", self._on_section_bind)
+        self._def_list_view.set_model(Gtk.NoSelection.new(self._definition_sections))
+        self._def_list_view.set_factory(section_factory)
+
         self.connect("unrealize", self._on_destroy)
         self._key_ctrlr.connect("key-pressed", self._on_key_pressed)
         self._history_listbox.connect("row-activated", self._on_history_item_activated)
 
-        self._def_ctrlr.connect("pressed", self._on_def_press_event)
-        self._def_ctrlr.connect("stopped", self._on_def_stop_event)
-        self._def_view.connect("activate-link", self._on_link_activated)
+        self._did_you_mean_label.connect("activate-link", self._on_link_activated)
 
         self.search_button.connect("clicked", self.on_search_clicked)
         self._search_entry.connect("changed", self._on_entry_changed)
@@ -102,10 +126,13 @@ class WordbookWindow(Adw.ApplicationWindow):
         self._style_manager = self.get_application().get_style_manager()
         self._style_manager.connect("notify::dark", self._on_dark_style)
 
+        base.DEFINITION_CACHE.max_bytes = Settings.get().definition_cache_size * 1024 * 1024
+        base.CUSTOM_DEFINITIONS.watch()
+
         # Loading and setup.
         self._dl_wn()
         if self._wn_downloader.check_status():
-            self._wn_future = base.get_wn_file(self._retry_dl_wn)
+            self._load_wn()
             self._set_header_sensitive(True)
             self._page_switch(Page.WELCOME)
             if self.lookup_term:
@@ -132,12 +159,10 @@ class WordbookWindow(Adw.ApplicationWindow):
         if not Settings.get().live_search:
             self.set_default_widget(self.search_button)
 
-        def_extra_menu_model = Gio.Menu.new()
+        # Extra menu model for the definition labels
+        self._def_extra_menu = Gio.Menu.new()
         item = Gio.MenuItem.new("Search Selected Text", "win.search-selected")
-        def_extra_menu_model.append_item(item)
-
-        # Set the extra menu model for the label
-        self._def_view.set_extra_menu(def_extra_menu_model)
+        self._def_extra_menu.append_item(item)
 
     def setup_actions(self):
         """Setup the Gio actions for the application window."""
@@ -208,7 +233,10 @@ class WordbookWindow(Adw.ApplicationWindow):
 
     def on_random_word(self, _action, _param):
         """Search a random word from the wordlist."""
-        random_word = random.choice(self._wn_future.result()["list"])
+        terms = self._completion_index.terms
+        if not terms:
+            return
+        random_word = random.choice(terms)
         random_word = random_word.replace("_", " ")
         self.trigger_search(random_word)
 
@@ -216,97 +244,113 @@ class WordbookWindow(Adw.ApplicationWindow):
         """Search selected text from inside or outside the window."""
         self.trigger_search(self._primary_clipboard_text)
 
-    def on_search_clicked(self, _button=None, pass_check=False, text=None):
+    def on_search_clicked(self, _button=None, pass_check=False, text=None, debounce=False):
         """Pass data to search function and set TextView data."""
         if text is None:
             text = self._search_entry.get_text().strip()
+        pending = self._search_scheduler.pending
+        if debounce and pending is not None and pending[0] == text:
+            # Setting the entry's text for a search that's already on its way, e.g. after a link click.
+            return
         self._page_switch(Page.SPINNER)
-        self._add_to_queue(text, pass_check)
-
-    def threaded_search(self, pass_check=False):
-        """Manage a single thread to search for each term."""
-        except_list = ("fortune -a", "cowfortune")
-        status = SearchStatus.NONE
-        while self._search_queue:
-            text = self._search_queue.pop(0)
-            orig_term = self._searched_term
-            self._searched_term = text
-            if text and (pass_check or not text == orig_term or text in except_list):
-                if not text.strip() == "":
-                    GLib.idle_add(self._def_view.set_markup, "")
-
-                    out = self._search(text)
-
-                    if out is None:
-                        status = SearchStatus.RESET
-                        continue
-
-                    def validate_result(text, out_string):
-                        # Add to history
-                        history_object = HistoryObject(text)
-                        if text not in self._search_history_list:
-                            self._search_history_list.append(text)
-                            self._search_history.insert(0, history_object)
-
-                        GLib.idle_add(self._def_view.set_markup, out_string)
-                        return SearchStatus.SUCCESS
-
-                    if out["out_string"] is not None:
-                        status = validate_result(text, out["out_string"])
-                    elif out["result"] is not None:
-                        status = validate_result(text, self._process_result(out["result"]))
-                    else:
-                        status = SearchStatus.FAILURE
-                        self._last_search_fail = True
-                        continue
-
-                    term_view_text = f'<span size="large" weight="bold">{out["term"].strip()}</span>'
-                    GLib.idle_add(
-                        self._term_view.set_markup,
-                        term_view_text,
-                    )
-                    GLib.idle_add(
-                        self._term_view.set_tooltip_markup,
-                        term_view_text,
-                    )
-
-                    pron = "<i>" + out["pronunciation"].strip().replace("\n", "") + "</i>"
-                    GLib.idle_add(
-                        self._pronunciation_view.set_markup,
-                        pron,
-                    )
-                    GLib.idle_add(
-                        self._pronunciation_view.set_tooltip_markup,
-                        pron,
-                    )
-
-                    if text not in except_list:
-                        GLib.idle_add(self._speak_button.set_visible, True)
-
-                    self._last_search_fail = False
-                    continue
-
-                status = SearchStatus.RESET
-                continue
-
-            if text and text == orig_term and not self._last_search_fail:
-                status = SearchStatus.SUCCESS
-                continue
-
-            if text and text == orig_term and self._last_search_fail:
-                status = SearchStatus.FAILURE
-                continue
-
-            status = SearchStatus.RESET
-
-        if status == SearchStatus.SUCCESS:
-            self._page_switch(Page.CONTENT)
-        elif status == SearchStatus.FAILURE:
-            self._page_switch(Page.SEARCH_FAIL)
-        elif status == SearchStatus.RESET:
+        self._prefetcher.cancel()
+        repeat = bool(text) and text == self._searched_term and not pass_check and text not in EXCEPT_LIST
+        self._search_scheduler.submit((text, repeat), debounce=debounce)
+
+    def threaded_search(self, request, token):
+        """
+        Look up a search request. Runs on the search scheduler's thread.
+
+        Returns as soon as the definition is ready. The pronunciation is shown
+        by _show_pronunciation once espeak-ng is done with it.
+        """
+        text, repeat = request
+        if repeat or not text or text.strip() == "":
+            return None
+        with tracing.span("search", text=text):
+            stages = self._search(text, token)
+            if stages is None:
+                return None
+            entry_future, pron_future = stages
+            out = entry_future.result()
+
+        def on_pronunciation(future):
+            if future.exception() is None:
+                self._search_scheduler.post(token, self._show_pronunciation, request, future.result())
+
+        pron_future.add_done_callback(on_pronunciation)
+        return out
+
+    def _show_search_result(self, request, out):
+        """Present the result of the latest search. Runs on the main loop."""
+        text, repeat = request
+        if repeat:
+            self._page_switch(Page.SEARCH_FAIL if self._last_search_fail else Page.CONTENT)
+            return
+
+        self._shown_request = request
+        self._searched_term = text
+        self._show_sections(())
+        if out is None:
+            if text and not text.strip() == "" and not Settings.get().live_search:
+                self._new_error(
+                    _("Invalid input"),
+                    _("Nothing definable was found in your search input"),
+                )
+            self._searched_term = None
             self._page_switch(Page.WELCOME)
+            return
+
+        sections = self._render(text, out)
+        if sections is None:
+            self._shown_result = None
+            self._last_search_fail = True
+            self._show_suggestions(text)
+            self._page_switch(Page.SEARCH_FAIL)
+            return
+
+        self._shown_result = out
+
+        # Add to history
+        if text not in self._search_history_list:
+            self._search_history_list.append(text)
+            self._search_history.insert(0, HistoryObject(text))
+        self._show_sections(sections)
+
+        term_view_text = f'<span size="large" weight="bold">{out["term"].strip()}</span>'
+        self._term_view.set_markup(term_view_text)
+        self._term_view.set_tooltip_markup(term_view_text)
+
+        if out["pronunciation"] is not None:
+            self._set_pronunciation(out["pronunciation"])
+        elif self._early_pronunciation is not None and self._early_pronunciation[0] is request:
+            self._set_pronunciation(self._early_pronunciation[1])
+        else:
+            self._set_pronunciation("")
+        self._early_pronunciation = None
+
+        if text not in EXCEPT_LIST:
+            self._speak_button.set_visible(True)
 
-        self._active_thread = None
+        if out.get("result") is not None:
+            self._prefetcher.start(out["result"], self._wn_future.result())
+
+        self._last_search_fail = False
+        self._page_switch(Page.CONTENT)
+
+    def _show_pronunciation(self, request, pronunciation):
+        """Show a pronunciation that was looked up after its definition. Runs on the main loop."""
+        if request is self._shown_request:
+            self._set_pronunciation(pronunciation)
+        else:
+            # The definition is still on its way to the main loop.
+            self._early_pronunciation = (request, pronunciation)
+
+    def _set_pronunciation(self, pronunciation):
+        """Set the pronunciation view."""
+        pron = "<i>" + pronunciation.strip().replace("\n", "") + "</i>"
+        self._pronunciation_view.set_markup(pron)
+        self._pronunciation_view.set_tooltip_markup(pron)
 
     def trigger_search(self, text):
         """Trigger search action."""
@@ -315,8 +359,58 @@ class WordbookWindow(Adw.ApplicationWindow):
 
     def _on_dark_style(self, _object, _param):
         """Refresh definition view when switching dark theme."""
-        if self._searched_term is not None:
-            self.on_search_clicked(pass_check=True, text=self._searched_term)
+        if self._shown_result is not None:
+            self._show_sections(self._render(self._searched_term, self._shown_result), scroll_to_top=False)
+
+    def _render(self, text, out) -> Sequence[str] | None:
+        """Turn a search result into sections of markup for the current theme, or None if nothing was found."""
+        dark_font = self._style_manager.get_dark()
+        if out["out_string"] is not None:
+            return (out["out_string"],)
+        if out.get("out_template") is not None:
+            return (base.render_template(out["out_template"], dark_font),)
+        if out.get("result") is not None:
+            # Keyed on the term the result was looked up for, which a custom definition's linkto can change.
+            lookup = out.get("lookup") or text
+            with tracing.span("render", text=text):
+                return RENDER_CACHE.render(lookup, base.WN_DB_VERSION, out["result"], *base.get_colors(dark_font))
+        return None
+
+    def _show_sections(self, sections: Sequence[str], scroll_to_top=True):
+        """Replace the sections in the definition view."""
+        self._definition_sections.splice(
+            0,
+            self._definition_sections.get_n_items(),
+            [DefinitionSection(markup) for markup in sections],
+        )
+        if scroll_to_top:
+            self._def_scroll.get_vadjustment().set_value(0)
+
+    def _on_section_setup(self, _factory, list_item):
+        """Create the label for a definition section."""
+        label = Gtk.Label(
+            wrap=True,
+            selectable=True,
+            xalign=0,
+            yalign=0,
+            margin_start=18,
+            margin_end=18,
+            margin_top=12,
+            margin_bottom=12,
+        )
+        label.set_extra_menu(self._def_extra_menu)
+        label.connect("activate-link", self._on_link_activated)
+        click = Gtk.GestureClick()
+        click.connect("pressed", self._on_def_press_event)
+        click.connect("stopped", self._on_def_stop_event)
+        label.add_controller(click)
+        list_item.set_activatable(False)
+        list_item.set_child(label)
+
+    @staticmethod
+    def _on_section_bind(_factory, list_item):
+        """Show a definition section in its label."""
+        list_item.get_child().set_markup(list_item.get_item().markup)
 
     def _on_def_press_event(self, _click, n_press, _x, _y):
         """Handle double click on definition view."""
@@ -341,6 +435,9 @@ class WordbookWindow(Adw.ApplicationWindow):
 
     def _on_destroy(self, _window):
         """Detect closing of the window."""
+        self._warmup_stop.set()
+        self._prefetcher.cancel()
+        self._search_scheduler.cancel()
         Settings.get().history = self._search_history_list[-10:]
 
     def _on_entry_changed(self, _entry):
@@ -348,14 +445,10 @@ class WordbookWindow(Adw.ApplicationWindow):
 
         self._completion_request_count += 1
         if self._completion_request_count == 1:
-            threading.Thread(
-                target=self._update_completions,
-                args=[self._search_entry.get_text()],
-                daemon=True,
-            ).start()
+            TASKS.submit(Priority.COMPLETION, self._update_completions, self._search_entry.get_text())
 
         if Settings.get().live_search:
-            GLib.idle_add(self.on_search_clicked)
+            GLib.idle_add(lambda: self.on_search_clicked(debounce=True))
 
     @staticmethod
     def _on_exit_clicked(_widget):
@@ -365,6 +458,7 @@ class WordbookWindow(Adw.ApplicationWindow):
     def _on_link_activated(self, _widget, data):
         """Search for terms that are marked as hyperlinks."""
         if data.startswith("search;"):
+            self._prefetcher.record_click(data[7:])
             GLib.idle_add(self._search_entry.set_text, data[7:])
             self.on_search_clicked(text=data[7:])
         return Gdk.EVENT_STOP
@@ -391,22 +485,35 @@ class WordbookWindow(Adw.ApplicationWindow):
         term = row.get_first_child().get_first_child().get_label()
         self.trigger_search(term)
 
+    def _on_wn_ready(self, future):
+        """Start reading the wordlist once WordNet is ready. Searches don't wait for it."""
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        PROFILE.mark("wordnet")
+        self._index_future = base.get_wn_index(future.result(), self._completion_index)
+        self._index_future.add_done_callback(self._on_index_ready)
+
+    def _on_index_ready(self, future):
+        """Build the fuzzy index and precompute pronunciations in the background once the wordlist is ready."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        PROFILE.mark("wordlist")
+        self._fuzzy_future = base.get_fuzzy_index(future.result().terms)
+
+        warmup = Settings.get().pronunciations_warmup
+        if warmup == "all":
+            terms = future.result().terms
+        elif warmup == "history":
+            terms = Settings.get().history
+        else:
+            return
+        base.warm_pronunciations(terms, Settings.get().pronunciations_accent, self._warmup_stop)
+
     def _on_retry_clicked(self, _widget):
         """Handle retry button click in network failure page."""
         self._page_switch(Page.DOWNLOAD)
         self._dl_wn()
 
-    def _add_to_queue(self, text, pass_check=False):
-        """Add search term to queue."""
-        if self._search_queue:
-            self._search_queue.pop(0)
-        self._search_queue.append(text)
-
-        if self._active_thread is None:
-            # If there is no active thread, create one and start it.
-            self._active_thread = threading.Thread(target=self.threaded_search, args=[pass_check], daemon=True)
-            self._active_thread.start()
-
     def _on_speak_clicked(self, _button):
         """Say the search entry out loud with espeak speech synthesis."""
         base.read_term(
@@ -418,13 +525,19 @@ class WordbookWindow(Adw.ApplicationWindow):
     def progress_complete(self):
         """Run upon completion of loading."""
         GLib.idle_add(self.download_status_page.set_title, _("Ready."))
-        self._wn_future = base.get_wn_file(self._retry_dl_wn)
+        self._load_wn()
         GLib.idle_add(self._set_header_sensitive, True)
         self._page_switch(Page.WELCOME)
         if self.lookup_term:
             self.trigger_search(self.lookup_term)
         self._search_entry.grab_focus_without_selecting()
 
+    def _load_wn(self):
+        """Open WordNet, then read its wordlist into a fresh completion index."""
+        self._completion_index = base.PartialCompletionIndex()
+        self._wn_future = base.get_wn_instance(self._retry_dl_wn)
+        self._wn_future.add_done_callback(self._on_wn_ready)
+
     @staticmethod
     def _create_label(element):
         """Create labels for history list."""
@@ -454,105 +567,44 @@ class WordbookWindow(Adw.ApplicationWindow):
         GLib.idle_add(self._main_stack.set_visible_child_name, page)
         return False
 
-    def _process_result(self, result: dict):
-        """Process results from wn."""
-        out_string = ""
-        word_col = result["word_col"]
-        sen_col = result["sen_col"]
-        first = True
-        for pos in result.keys():
-            i = 0
-            orig_synset = None
-            if pos not in ("word_col", "sen_col") and result[pos]:
-                for synset in sorted(result[pos], key=lambda k: k["name"]):
-                    synset_name = synset["name"]
-                    if orig_synset is None:
-                        i = 1
-                        if not first:
-                            out_string += "\n\n"
-                        out_string += f"{synset_name} ~ <b>{pos}</b>"
-                        orig_synset = synset_name
-                        first = False
-                    elif synset_name != orig_synset:
-                        i = 1
-                        out_string += f"\n\n{synset_name} ~ <b>{pos}</b>"
-                        orig_synset = synset_name
-                    else:
-                        i += 1
-                    out_string += f'\n  <b>{i}</b>: {synset["definition"]}'
-
-                    for example in synset["examples"]:
-                        out_string += f'\n        <span foreground="{sen_col}">{example}</span>'
-
-                    pretty_syn = self._process_word_links(synset["syn"], word_col)
-                    if pretty_syn:
-                        out_string += f"\n        Synonyms:<i> {pretty_syn}</i>"
-
-                    pretty_ant = self._process_word_links(synset["ant"], word_col)
-                    if pretty_ant:
-                        out_string += f"\n        Antonyms:<i> {pretty_ant}</i>"
-
-                    pretty_sims = self._process_word_links(synset["sim"], word_col)
-                    if pretty_sims:
-                        out_string += f"\n        Similar to:<i> {pretty_sims}</i>"
-
-                    pretty_alsos = self._process_word_links(synset["also_sees"], word_col)
-                    if pretty_alsos:
-                        out_string += f"\n        Also see:<i> {pretty_alsos}</i>"
-        return out_string
-
-    @staticmethod
-    def _process_word_links(word_list, word_col):
-        """Process word links like synonyms, antonyms, etc."""
-        pretty_list = []
-        for word in word_list:
-            pretty_list.append(f'<span foreground="{word_col}">' f'<a href="search;{word}">{word}</a>' "</span>")
-        if pretty_list:
-            pretty_list = ", ".join(pretty_list)
-            return pretty_list
-        return ""
-
-    def _search(self, search_text):
-        """Clean input text, give errors and pass data to formatter."""
-        text = base.clean_search_terms(search_text)
+    def _search(self, search_text, token=None):
+        """Clean input text and pass data to formatter, returning futures for the entry and its pronunciation."""
+        with tracing.span("clean_search_terms"):
+            text = base.clean_search_terms(search_text)
         if not text == "" and not text.isspace():
-            return base.format_output(
+            return base.format_output_staged(
                 text,
-                self._style_manager.get_dark(),
-                self._wn_future.result()["instance"],
+                self._wn_future.result(),
                 Settings.get().cdef,
                 accent=Settings.get().pronunciations_accent,
+                token=token,
             )
-        if not Settings.get().live_search:
-            GLib.idle_add(
-                self._new_error,
-                _("Invalid input"),
-                _("Nothing definable was found in your search input"),
-            )
-        self._searched_term = None
         return None
 
+    def _show_suggestions(self, text):
+        """Offer terms close to one that wasn't found."""
+        suggestions = []
+        if self._fuzzy_future is not None and self._fuzzy_future.done() and self._fuzzy_future.exception() is None:
+            suggestions = self._fuzzy_future.result().suggest(base.clean_search_terms(text))
+        if suggestions:
+            links = ", ".join(f'<a href="search;{escape(word)}">{escape(word)}</a>' for word in suggestions)
+            GLib.idle_add(self._did_you_mean_label.set_markup, _("Did you mean {links}?").format(links=links))
+        GLib.idle_add(self._did_you_mean_label.set_visible, bool(suggestions))
+
     def _update_completions(self, text):
         """Update completions from wordlist and cdef folder."""
         while self._completion_request_count > 0:
             completer_liststore = Gtk.ListStore(str)
-            _complete_list = []
-
-            for item in self._wn_future.result()["list"]:
-                if len(_complete_list) >= 10:
-                    break
-                item = item.replace("_", " ")
-                if item.lower().startswith(text.lower()) and item not in _complete_list:
-                    _complete_list.append(item)
+            _complete_list = self._completion_index.complete(text, limit=10)
 
             if Settings.get().cdef:
-                for item in os.listdir(utils.CDEF_DIR):
+                for item in base.CUSTOM_DEFINITIONS.complete(text, limit=10):
                     # FIXME: There is no indicator that this is a custom definition
                     # Not a priority but a nice-to-have.
                     if len(_complete_list) >= 10:
                         break
-                    item = escape(item).replace("_", " ")
-                    if item.lower().startswith(text.lower()) and item not in _complete_list:
+                    item = escape(item)
+                    if item not in _complete_list:
                         _complete_list.append(item)
 
             _complete_list = sorted(_complete_list, key=str.casefold)
@@ -574,13 +626,15 @@ class WordbookWindow(Adw.ApplicationWindow):
         self._set_header_sensitive(False)
         if not self._wn_downloader.check_status():
             self.download_status_page.set_description(_("Downloading WordNet…"))
-            threading.Thread(target=self._try_dl_wn).start()
+            TASKS.submit(Priority.MAINTENANCE, self._try_dl_wn)
 
     def _try_dl_wn(self):
         """Attempt to download WordNet data."""
+        from wordbook.progress import ProgressUpdater
+
         try:
             self._wn_downloader.download(ProgressUpdater)
-        except Error as err:
+        except base.import_wn().Error as err:
             self._network_fail_status_page.set_description(f"<small><tt>Error: {err}</tt></small>")
             utils.log_warning(err)
             self._page_switch(Page.NETWORK_FAIL)
@@ -599,13 +653,6 @@ class WordbookWindow(Adw.ApplicationWindow):
         )
 
 
-class SearchStatus(Enum):
-    NONE = 0
-    SUCCESS = 1
-    FAILURE = 2
-    RESET = 3
-
-
 class Page(str, Enum):
     CONTENT = "content_page"
     DOWNLOAD = "download_page"
@@ -615,40 +662,17 @@ class Page(str, Enum):
     WELCOME = "welcome_page"
 
 
+class DefinitionSection(GObject.Object):
+    markup = ""
+
+    def __init__(self, markup):
+        super().__init__()
+        self.markup = markup
+
+
 class HistoryObject(GObject.Object):
     term = ""
 
     def __init__(self, term):
         super().__init__()
         self.term = term
-
-
-class ProgressUpdater(ProgressHandler):
-    def update(self, n: int = 1, force: bool = False):
-        """Update the progress bar."""
-        self.kwargs["count"] += n
-        if self.kwargs["total"] > 0:
-            progress_fraction = self.kwargs["count"] / self.kwargs["total"]
-            GLib.idle_add(
-                Gio.Application.get_default().win.loading_progress.set_fraction,
-                progress_fraction,
-            )
-
-    @staticmethod
-    def flash(message):
-        """Update the progress label."""
-        if message == "Database":
-            GLib.idle_add(
-                Gio.Application.get_default().win.download_status_page.set_description,
-                _("Building Database…"),
-            )
-        else:
-            GLib.idle_add(
-                Gio.Application.get_default().win.download_status_page.set_description,
-                message,
-            )
-
-    def close(self):
-        """Signal the completion of building the WordNet database."""
-        if self.kwargs["message"] not in ("Download", "Read"):
-            Gio.Application.get_default().win.progress_complete()